@@ -3,13 +3,94 @@ Relationship Reflection App - Streamlit MVT
 A guided reflection tool for exploring relationship dynamics.
 """
 
+import functools
+import uuid
+from datetime import datetime
 import streamlit as st
 from questions import get_topic_list, get_topic_data, get_topic_prompt
-from firebase_utils import save_user_profile, save_responses, save_rating, get_topic_stats
-from openai_utils import generate_question, generate_summary, generate_insight
+from config import get_setting
+from llm_metrics import Timer, record_render, start_metrics_server
+from warmup import start_warmup
+from firebase_utils import (
+    save_user_profile, save_session_results, get_all_topic_stats,
+    save_session_checkpoint, load_session_checkpoint,
+    get_user_responses_page, get_response_transcript, HISTORY_FIELDS
+)
+from topic_analytics import load_topic_report
+from openai_utils import clean_question, generate_question, generate_reflection, prefetch_stream, stream_insight, stream_question, stream_summary
+
+def timed_fragment(func):
+    """
+    Run func as an st.fragment, recording how long each of its runs takes.
+    
+    Interacting with a widget inside a fragment reruns only that fragment.
+    With [app] use_fragments = false it is a plain function again, which
+    is useful for comparing render times.
+    """
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        timer = Timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record_render(f"fragment:{func.__name__}", timer.elapsed())
+    
+    if get_setting('app', 'use_fragments', True):
+        return st.fragment(timed)
+    return timed
+
+def checkpoint_session(fields=None, questions=None, responses=None, reset=False):
+    """Merge the given progress into this session's checkpoint document."""
+    session_id = st.session_state.get('session_id')
+    if not session_id or not get_setting('app', 'checkpoint_sessions', True):
+        return
+    save_session_checkpoint(session_id, fields or {}, questions, responses, reset)
+
+def restore_session():
+    """
+    Restore a checkpointed session from the ?session= token in the URL.
+    
+    Questions that were already generated are restored as they were, so
+    resuming never generates them again.
+    """
+    session_id = st.query_params.get('session')
+    if not session_id or not get_setting('app', 'checkpoint_sessions', True):
+        return
+    session = load_session_checkpoint(session_id)
+    if not session or not session.get('user_id'):
+        return
+    
+    st.session_state.session_id = session_id
+    st.session_state.user_id = session['user_id']
+    st.session_state.user_profile = session.get('user_profile', {})
+    st.session_state.stage = 'topic_selection'
+    
+    topic = session.get('topic')
+    if session.get('stage') not in ('questions', 'summary') or not topic:
+        return
+    
+    questions = session['questions']
+    responses = session['responses']
+    current_q = min(session.get('current_question', len(responses)), 4)
+    st.session_state.selected_topic = topic
+    st.session_state.stage = session['stage']
+    st.session_state.questions = questions
+    st.session_state.responses = responses
+    st.session_state.current_question = current_q
+    st.session_state.current_question_text = questions[current_q] if current_q < len(questions) else ""
+    st.session_state.insights = session.get('insights', "")
+    st.session_state.summary = session.get('summary', "")
+    # Regenerate a reflection that was still being written when the session dropped
+    st.session_state.reflection_pending = session['stage'] == 'summary' and not st.session_state.summary
+    
+    # Pre-fill the answer boxes with the saved responses
+    for i, response in enumerate(responses):
+        st.session_state[f"response_{i}"] = response
 
 def initialize_session_state():
     """Initialize session state variables."""
+    if 'stage' not in st.session_state:
+        restore_session()
     if 'stage' not in st.session_state:
         st.session_state.stage = 'profile'
     if 'user_id' not in st.session_state:
@@ -32,6 +113,10 @@ def initialize_session_state():
         st.session_state.insights = ""
     if 'show_cancel_confirm' not in st.session_state:
         st.session_state.show_cancel_confirm = False
+    if 'reflection_pending' not in st.session_state:
+        st.session_state.reflection_pending = False
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = None
 
 def show_profile_form():
     """Display user profile input form."""
@@ -73,6 +158,16 @@ def show_profile_form():
                         'relationship_status': relationship_status
                     }
                     st.session_state.stage = 'topic_selection'
+                    
+                    # The session token in the URL lets this session be resumed
+                    st.session_state.session_id = uuid.uuid4().hex
+                    st.query_params['session'] = st.session_state.session_id
+                    checkpoint_session({
+                        'user_id': user_id,
+                        'user_profile': st.session_state.user_profile,
+                        'stage': 'topic_selection',
+                        'created_at': datetime.now()
+                    })
                     st.rerun()
             else:
                 st.error("Please enter your name to continue.")
@@ -87,10 +182,13 @@ def show_topic_selection():
     st.markdown("Each topic contains 5 questions designed to help you explore different aspects of your relationship.")
     
     topics = get_topic_list()
+    all_stats = get_all_topic_stats()
+    # Precomputed offline by topic_analytics.py; empty until a report is built
+    report = load_topic_report()
     
     for topic_key, topic_title in topics:
         topic_data = get_topic_data(topic_key)
-        stats = get_topic_stats(topic_key)
+        stats = all_stats[topic_key]
         
         with st.container():
             col1, col2 = st.columns([3, 1])
@@ -103,6 +201,17 @@ def show_topic_selection():
                     st.caption(f"✨ {stats['response_count']} people have explored this topic")
                     if stats['rating_count'] > 0:
                         st.caption(f"⭐ Average rating: {stats['avg_rating']}/5")
+                
+                topic_report = report.get(topic_key, {})
+                ratings = topic_report.get('ratings', {})
+                dimensions = [(key, label) for key, label in
+                              [('informative', "Informative"), ('engaging', "Engaging"), ('repeat', "Would repeat")]
+                              if ratings.get(key, {}).get('mean') is not None]
+                if dimensions:
+                    st.caption("📈 " + " · ".join(f"{label} {ratings[key]['mean']}/5" for key, label in dimensions))
+                answer_words = topic_report.get('lengths', {}).get('answer_words', {}).get('p50')
+                if answer_words:
+                    st.caption(f"✍️ Answers are typically about {int(answer_words)} words")
             
             with col2:
                 if st.button("Select", key=f"select_{topic_key}", type="primary"):
@@ -115,9 +224,89 @@ def show_topic_selection():
                     st.session_state.summary = ""
                     st.session_state.insights = ""
                     st.session_state.show_cancel_confirm = False
+                    checkpoint_session({
+                        'stage': 'questions',
+                        'topic': topic_key,
+                        'current_question': 0,
+                        'insights': "",
+                        'summary': ""
+                    }, reset=True)
                     st.rerun()
             
             st.markdown("---")
+    
+    show_history()
+
+def load_history_page():
+    """Append the next page of the user's past reflections (metadata only)."""
+    items, cursor = get_user_responses_page(
+        st.session_state.user_id,
+        page_size=get_setting('app', 'history_page_size', 10),
+        start_after=st.session_state.history_cursor,
+        fields=HISTORY_FIELDS
+    )
+    st.session_state.history_items.extend(items)
+    st.session_state.history_cursor = cursor
+
+def show_history():
+    """List the user's past reflections, fetching each transcript only when opened."""
+    if not st.toggle("📚 Show your past reflections", key="show_history"):
+        return
+    
+    # Start over if the history belongs to a previous profile or is stale
+    if st.session_state.get('history_user_id') != st.session_state.user_id:
+        st.session_state.history_user_id = st.session_state.user_id
+        st.session_state.history_items = []
+        st.session_state.history_cursor = None
+        st.session_state.history_transcripts = {}
+        try:
+            load_history_page()
+        except Exception as e:
+            st.error(f"Error retrieving your past reflections: {str(e)}")
+            return
+    
+    if not st.session_state.history_items:
+        st.caption("Your completed reflections will appear here.")
+        return
+    
+    for item in st.session_state.history_items:
+        response_id = item.get('response_id')
+        topic_data = get_topic_data(item.get('topic'))
+        topic_title = topic_data['title'] if topic_data else item.get('topic', "Reflection")
+        completed_at = item.get('completed_at')
+        completed_text = completed_at.strftime('%b %d, %Y') if completed_at else ""
+        
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.markdown(f"**{topic_title}**")
+            if completed_text:
+                st.caption(completed_text)
+        with col2:
+            is_open = response_id in st.session_state.history_transcripts
+            if st.button("Hide" if is_open else "View", key=f"history_{response_id}"):
+                if is_open:
+                    del st.session_state.history_transcripts[response_id]
+                    st.rerun()
+                transcript = get_response_transcript(response_id)
+                if transcript is not None:
+                    st.session_state.history_transcripts[response_id] = transcript
+                    st.rerun()
+                # Missing or unreadable (errors are already shown): leave it closed
+                st.warning("This reflection couldn't be loaded.")
+        
+        transcript = st.session_state.history_transcripts.get(response_id)
+        if transcript:
+            for pair in transcript['qa_pairs']:
+                st.markdown(f"**Question {pair['question_number']}:** *{pair['question']}*")
+                st.markdown(pair['response'])
+    
+    if st.session_state.history_cursor is not None:
+        if st.button("Load more"):
+            try:
+                load_history_page()
+            except Exception as e:
+                st.error(f"Error retrieving your past reflections: {str(e)}")
+            st.rerun()
 
 def show_questions():
     """Display the question flow with AI-generated questions."""
@@ -146,6 +335,7 @@ def show_questions():
                 st.session_state.current_question_text = ""
                 st.session_state.summary = ""
                 st.session_state.insights = ""
+                checkpoint_session({'stage': 'topic_selection', 'topic': None}, reset=True)
                 st.rerun()
     
     # Show cancel confirmation dialog if needed
@@ -167,6 +357,7 @@ def show_questions():
                     st.session_state.summary = ""
                     st.session_state.insights = ""
                     st.session_state.show_cancel_confirm = False
+                    checkpoint_session({'stage': 'topic_selection', 'topic': None}, reset=True)
                     st.rerun()
             
             with col2:
@@ -190,6 +381,14 @@ def show_questions():
         st.info(f"💡 **About this topic:** {topic_data['description']}")
         st.markdown("---")
     
+    # The answer controls are a fragment, so typing an answer reruns only
+    # them; the transcript and question have no widgets of their own
+    show_transcript()
+    show_current_question(current_q)
+    show_answer_controls(current_q, total_questions)
+
+def show_transcript():
+    """Display the questions and answers so far."""
     # Show all previous Q&A pairs vertically
     if st.session_state.responses:
         st.markdown("### Your Conversation")
@@ -208,32 +407,53 @@ def show_questions():
                 st.markdown(response)
             
             st.markdown("---")
-    
-    # Generate current question if not already generated
-    if not st.session_state.current_question_text:
-        with st.spinner("Generating your personalized question..."):
-            st.session_state.current_question_text = generate_question(
-                topic_key=st.session_state.selected_topic,
-                question_number=current_q + 1,
-                previous_responses=st.session_state.responses,
-                user_profile=st.session_state.user_profile
-            )
-            
-            # Save the generated question to our questions list
-            # Extend the list if needed to match current question index
-            while len(st.session_state.questions) <= current_q:
-                st.session_state.questions.append("")
-            st.session_state.questions[current_q] = st.session_state.current_question_text
-    
+
+def show_current_question(current_q):
+    """Display the current question, generating it first if needed."""
     # Current question (prominently displayed)
     st.markdown(f"### Question {current_q + 1}")
-    st.markdown(f"**{st.session_state.current_question_text}**")
+    question_placeholder = st.empty()
     
+    # Generate current question if not already generated
+    if not st.session_state.current_question_text:
+        if get_setting('openai', 'stream_responses', True):
+            # Stream the question in as it is generated
+            with question_placeholder.container():
+                streamed_question = st.write_stream(stream_question(
+                    topic_key=st.session_state.selected_topic,
+                    question_number=current_q + 1,
+                    previous_responses=st.session_state.responses,
+                    user_profile=st.session_state.user_profile
+                ))
+            st.session_state.current_question_text = clean_question(streamed_question, current_q + 1)
+        else:
+            with st.spinner("Generating your personalized question..."):
+                st.session_state.current_question_text = generate_question(
+                    topic_key=st.session_state.selected_topic,
+                    question_number=current_q + 1,
+                    previous_responses=st.session_state.responses,
+                    user_profile=st.session_state.user_profile
+                )
+        
+        # Save the generated question to our questions list
+        # Extend the list if needed to match current question index
+        while len(st.session_state.questions) <= current_q:
+            st.session_state.questions.append("")
+        st.session_state.questions[current_q] = st.session_state.current_question_text
+        # Keep the generated question so a resumed session doesn't pay for it again
+        checkpoint_session(questions={current_q: st.session_state.current_question_text})
+    
+    question_placeholder.markdown(f"**{st.session_state.current_question_text}**")
+
+@timed_fragment
+def show_answer_controls(current_q, total_questions):
+    """Display the answer box and the navigation buttons."""
     # Response input
     response = st.text_area(
         "Your reflection:",
         height=150,
         placeholder="Take your time to reflect and share your thoughts...",
+        max_chars=get_setting('app', 'max_answer_chars', 5000),
         key=f"response_{current_q}"
     )
     
@@ -249,6 +469,7 @@ def show_questions():
                     st.session_state.current_question_text = st.session_state.questions[prev_q]
                 else:
                     st.session_state.current_question_text = ""  # Clear for regeneration
+                checkpoint_session({'current_question': prev_q})
                 st.rerun()
     
     with col3:
@@ -263,6 +484,7 @@ def show_questions():
                     
                     st.session_state.current_question += 1
                     st.session_state.current_question_text = ""  # Clear question for regeneration
+                    checkpoint_session({'current_question': current_q + 1}, responses={current_q: response})
                     st.rerun()
             else:
                 if st.button("Complete Exercise", type="primary"):
@@ -272,22 +494,29 @@ def show_questions():
                     else:
                         st.session_state.responses[current_q] = response
                     
-                    # Generate AI insights and summary
-                    with st.spinner("Generating your personalized insights..."):
-                        # Generate insights first
-                        st.session_state.insights = generate_insight(
-                            topic_key=st.session_state.selected_topic,
-                            responses=st.session_state.responses,
-                            user_profile=st.session_state.user_profile
-                        )
-                        
-                        # Then generate summary
-                        st.session_state.summary = generate_summary(
-                            topic_key=st.session_state.selected_topic,
-                            responses=st.session_state.responses,
-                            user_profile=st.session_state.user_profile
-                        )
+                    if get_setting('openai', 'stream_reflection', False):
+                        # Opt-in: insights and summary are streamed in on the summary
+                        # page as two calls, trading the single call's savings for
+                        # earlier first tokens
+                        st.session_state.insights = ""
+                        st.session_state.summary = ""
+                        st.session_state.reflection_pending = True
+                    else:
+                        # Generate AI insights and summary
+                        with st.spinner("Generating your personalized insights..."):
+                            # Insights and summary come back from a single structured call
+                            st.session_state.insights, st.session_state.summary = generate_reflection(
+                                topic_key=st.session_state.selected_topic,
+                                responses=st.session_state.responses,
+                                user_profile=st.session_state.user_profile
+                            )
+                        st.session_state.reflection_pending = False
                     st.session_state.stage = 'summary'
+                    checkpoint_session({
+                        'stage': 'summary',
+                        'insights': st.session_state.insights,
+                        'summary': st.session_state.summary
+                    }, responses={current_q: response})
                     st.rerun()
 
 
@@ -298,6 +527,30 @@ def show_summary():
     st.title("✨ Your Reflection Summary")
     st.markdown("---")
     
+    # Stream insights and summary in, fetching the summary in the background meanwhile
+    if st.session_state.reflection_pending:
+        summary_stream = prefetch_stream(stream_summary(
+            topic_key=st.session_state.selected_topic,
+            responses=st.session_state.responses,
+            user_profile=st.session_state.user_profile
+        ))
+        
+        st.markdown("### 💡 Key Insights")
+        insights = st.write_stream(stream_insight(
+            topic_key=st.session_state.selected_topic,
+            responses=st.session_state.responses,
+            user_profile=st.session_state.user_profile
+        ))
+        
+        st.markdown("### 📝 Detailed Summary")
+        summary = st.write_stream(summary_stream)
+        
+        st.session_state.insights = insights.strip()
+        st.session_state.summary = summary.strip()
+        st.session_state.reflection_pending = False
+        checkpoint_session({'insights': st.session_state.insights, 'summary': st.session_state.summary})
+        st.rerun()
+    
     # Display insights prominently
     if st.session_state.insights:
         st.markdown("### 💡 Key Insights")
@@ -378,17 +631,12 @@ def show_summary():
     
     with col1:
         if st.button("Submit Rating", type="primary"):
-            # Save responses and rating
-            response_id = save_responses(
+            # Save responses and rating together in one atomic write
+            response_id, rating_id = save_session_results(
                 st.session_state.user_id,
                 st.session_state.selected_topic,
                 st.session_state.questions,
-                st.session_state.responses
-            )
-            
-            rating_id = save_rating(
-                st.session_state.user_id,
-                st.session_state.selected_topic,
+                st.session_state.responses,
                 {
                     'informative': informative_rating,
                     'engaging': engaging_rating,
@@ -398,6 +646,9 @@ def show_summary():
             )
             
             if response_id and rating_id:
+                checkpoint_session({'stage': 'completed'})
+                # Reload the history list next time it is shown
+                st.session_state.pop('history_user_id', None)
                 st.success("Thank you for your feedback! Your responses have been saved.")
                 st.balloons()
             
@@ -413,10 +664,14 @@ def show_summary():
             st.session_state.summary = ""
             st.session_state.insights = ""
             st.session_state.show_cancel_confirm = False
+            checkpoint_session({'stage': 'topic_selection', 'topic': None}, reset=True)
             st.rerun()
 
 def main():
     """Main app function."""
+    # Full script runs are timed per stage; fragment-only reruns are timed by timed_fragment
+    render_timer = Timer()
+    
     st.set_page_config(
         page_title="Bonded - Relationship Discovery",
         page_icon="💕",
@@ -440,17 +695,23 @@ def main():
     </style>
     """, unsafe_allow_html=True)
     
+    # Warm up Firebase and OpenAI in the background while the first page renders
+    start_warmup()
     initialize_session_state()
+    start_metrics_server()
     
     # Route to appropriate stage
-    if st.session_state.stage == 'profile':
+    stage = st.session_state.stage
+    if stage == 'profile':
         show_profile_form()
-    elif st.session_state.stage == 'topic_selection':
+    elif stage == 'topic_selection':
         show_topic_selection()
-    elif st.session_state.stage == 'questions':
+    elif stage == 'questions':
         show_questions()
-    elif st.session_state.stage == 'summary':
+    elif stage == 'summary':
         show_summary()
+    
+    record_render(f"app:{stage}", render_timer.elapsed())
 
 if __name__ == "__main__":
     main()
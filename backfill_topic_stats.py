@@ -0,0 +1,24 @@
+"""
+Seed the per-topic stats shards from existing Firestore data.
+
+Usage:
+    python backfill_topic_stats.py
+"""
+
+from firebase_utils import backfill_topic_stats
+
+def main():
+    """Recompute topic stats and print the totals written."""
+    totals = backfill_topic_stats()
+    
+    if not totals:
+        print("No responses or ratings found.")
+        return
+    
+    for topic, counts in sorted(totals.items()):
+        avg_rating = counts['rating_sum'] / counts['rating_count'] if counts['rating_count'] else 0
+        print(f"{topic}: {counts['response_count']} responses, "
+              f"{counts['rating_count']} ratings, avg {avg_rating:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Build the question bank served while the LLM circuit is open.
+
+Generates a few stand-alone questions per topic and question number from
+questions.TOPICS and writes them to question_bank.json, which the app
+loads once at startup. Re-run after changing a topic prompt, and ship the
+file with the app.
+
+Usage:
+    python build_question_bank.py --variants 3 --model gpt-5-mini
+"""
+
+import argparse
+from openai_utils import build_question_bank
+from question_bank import DEFAULT_BANK_PATH
+
+def main():
+    """Build the bank, printing each topic and question number as it finishes."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=DEFAULT_BANK_PATH, help="Question bank file to write")
+    parser.add_argument("--variants", type=int, default=3, help="Questions per topic and question number")
+    parser.add_argument("--questions", type=int, default=5, help="Questions per exercise")
+    parser.add_argument("--model", default="gpt-5-mini", help="Model to generate the questions with")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once")
+    args = parser.parse_args()
+    
+    def report(topic_key, question_number, questions):
+        print(f"{topic_key} question {question_number}: {len(questions)} variant(s)")
+    
+    topics = build_question_bank(
+        args.output,
+        variants=args.variants,
+        total_questions=args.questions,
+        model=args.model,
+        concurrency=args.concurrency,
+        on_progress=report
+    )
+    
+    total = sum(len(questions) for slots in topics.values() for questions in slots)
+    print(f"Wrote {total} questions for {len(topics)} topics to {args.output}.")
+
+if __name__ == "__main__":
+    main()
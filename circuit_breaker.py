@@ -0,0 +1,134 @@
+"""
+Circuit breaker for the Relationship Reflection App's LLM calls.
+
+Once the share of failed calls in a sliding window crosses a threshold,
+the circuit opens and calls fail immediately with CircuitOpen instead of
+waiting for timeouts and retries, so callers can serve their fallbacks at
+once. After a cool-down one probe call is let through; if it succeeds the
+circuit closes again, otherwise it stays open for another cool-down.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+import streamlit as st
+from config import get_setting
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpen(Exception):
+    """Raised instead of making a call while the circuit is open."""
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker over a sliding time window."""
+
+    def __init__(self, failure_threshold=0.5, min_calls=5, window=60, open_seconds=30):
+        """
+        Args:
+            failure_threshold: Share of failed calls in the window that opens the circuit
+            min_calls: Calls needed in the window before the rate is trusted
+            window: Seconds of call outcomes considered
+            open_seconds: Seconds the circuit stays open before a probe call
+        """
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self._outcomes = deque()  # (timestamp, failed)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return self._state
+
+    def before_call(self):
+        """
+        Check that a call may go ahead.
+
+        Raises:
+            CircuitOpen: While the circuit is open, or a probe is already in flight
+        """
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self._rejected += 1
+                    raise CircuitOpen("LLM circuit is open")
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == HALF_OPEN:
+                if self._probe_in_flight:
+                    self._rejected += 1
+                    raise CircuitOpen("LLM circuit is half-open and probing")
+                self._probe_in_flight = True
+
+    def cancel_call(self):
+        """Record that a call allowed by before_call was never made."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record_success(self):
+        """Record a call that got an answer (including a non-retryable API error)."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                logger.warning("LLM circuit closed after a successful probe")
+                self._state = CLOSED
+                self._outcomes.clear()
+            self._add_outcome(False)
+
+    def record_failure(self):
+        """Record a call that failed with a timeout, rate limit, server or network error."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open()
+                return
+            self._add_outcome(True)
+            failures = sum(failed for _, failed in self._outcomes)
+            if (self._state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_threshold):
+                self._open()
+
+    def stats(self):
+        """Current state, calls and failures in the window, and calls rejected while open."""
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                'state': self._state,
+                'calls': len(self._outcomes),
+                'failures': sum(failed for _, failed in self._outcomes),
+                'rejected': self._rejected
+            }
+
+    def _add_outcome(self, failed):
+        now = time.monotonic()
+        self._outcomes.append((now, failed))
+        self._trim(now)
+
+    def _trim(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _open(self):
+        logger.warning("LLM circuit opened; failing fast for %ss", self.open_seconds)
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+@st.cache_resource
+def get_circuit_breaker():
+    """Get the process-wide circuit breaker for OpenAI calls."""
+    return CircuitBreaker(
+        failure_threshold=get_setting('circuit_breaker', 'failure_threshold', 0.5),
+        min_calls=get_setting('circuit_breaker', 'min_calls', 5),
+        window=get_setting('circuit_breaker', 'window', 60),
+        open_seconds=get_setting('circuit_breaker', 'open_seconds', 30)
+    )
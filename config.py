@@ -1,40 +1,64 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
-import streamlit as st
 import os
+import threading
+import streamlit as st
+
+_firebase_lock = threading.Lock()
 
 def initialize_firebase():
     """Initialize Firebase connection if not already initialized."""
-    if not firebase_admin._apps:
-        # Try to get Firebase credentials from Streamlit secrets first
-        try:
-            # For Streamlit Cloud deployment
-            firebase_config = st.secrets["firebase"]
-            cred = credentials.Certificate({
-                "type": firebase_config["type"],
-                "project_id": firebase_config["project_id"],
-                "private_key_id": firebase_config["private_key_id"],
-                "private_key": firebase_config["private_key"],
-                "client_email": firebase_config["client_email"],
-                "client_id": firebase_config["client_id"],
-                "auth_uri": firebase_config["auth_uri"],
-                "token_uri": firebase_config["token_uri"],
-                "auth_provider_x509_cert_url": firebase_config["auth_provider_x509_cert_url"],
-                "client_x509_cert_url": firebase_config["client_x509_cert_url"]
-            })
-        except:
-            # For local development - use service account key file
-            if os.path.exists("firebase_key.json"):
-                cred = credentials.Certificate("firebase_key.json")
-            else:
-                st.error("Firebase credentials not found. Please add firebase_key.json or configure Streamlit secrets.")
-                st.stop()
+    # Imported here so firebase_admin and grpc aren't loaded before the first page renders
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    
+    # The warm-up thread and the first save may both get here first
+    with _firebase_lock:
+        if not firebase_admin._apps:
+            # Try to get Firebase credentials from Streamlit secrets first
+            try:
+                # For Streamlit Cloud deployment
+                firebase_config = st.secrets["firebase"]
+                cred = credentials.Certificate({
+                    "type": firebase_config["type"],
+                    "project_id": firebase_config["project_id"],
+                    "private_key_id": firebase_config["private_key_id"],
+                    "private_key": firebase_config["private_key"],
+                    "client_email": firebase_config["client_email"],
+                    "client_id": firebase_config["client_id"],
+                    "auth_uri": firebase_config["auth_uri"],
+                    "token_uri": firebase_config["token_uri"],
+                    "auth_provider_x509_cert_url": firebase_config["auth_provider_x509_cert_url"],
+                    "client_x509_cert_url": firebase_config["client_x509_cert_url"]
+                })
+            except:
+                # For local development - use service account key file
+                if os.path.exists("firebase_key.json"):
+                    cred = credentials.Certificate("firebase_key.json")
+                else:
+                    st.error("Firebase credentials not found. Please add firebase_key.json or configure Streamlit secrets.")
+                    st.stop()
         
-        firebase_admin.initialize_app(cred)
+            firebase_admin.initialize_app(cred)
     
     return firestore.client()
 
 # Initialize database connection
 def get_db():
     """Get Firestore database client."""
+    if use_fake_backends():
+        from fake_backends import get_fake_db
+        return get_fake_db()
     return initialize_firebase()
+
+def get_setting(section, key, default=None):
+    """Read an optional setting from Streamlit secrets, falling back to a default."""
+    try:
+        return st.secrets.get(section, {}).get(key, default)
+    except Exception:
+        # No secrets file configured (e.g. local scripts)
+        return default
+
+def use_fake_backends():
+    """Whether to use the in-process OpenAI and Firestore stand-ins (for load tests)."""
+    if os.environ.get("DDMVT_FAKE_BACKENDS", "").lower() in ("1", "true", "yes"):
+        return True
+    return bool(get_setting('app', 'fake_backends', False))
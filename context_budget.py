@@ -0,0 +1,162 @@
+"""
+Token budgeting for the Relationship Reflection App's LLM prompts.
+
+Keeps each call's prompt within a configurable token budget. The newest
+responses are kept verbatim; once the history no longer fits, older
+responses are folded into a compact rolling digest. Digests are cached
+process-wide by content hash so reruns don't recompute them.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from config import get_setting
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+# Tokens added per chat message for role and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_digest_cache = OrderedDict()
+_digest_lock = threading.Lock()
+DIGEST_CACHE_SIZE = 1024
+
+def _get_encoding():
+    """Load the tokenizer on first use (it is slow to import), or None without tiktoken."""
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                # tiktoken is optional; fall back to a rough characters-per-token estimate
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+def count_tokens(text):
+    """Count (or estimate, without tiktoken) the tokens in text."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+def count_message_tokens(messages):
+    """Count the prompt tokens for a list of chat messages."""
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+def clip_to_tokens(text, max_tokens):
+    """Shorten text to at most max_tokens, marking the cut with an ellipsis."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]).rstrip() + "…"
+    return text[:max_tokens * 4].rstrip() + "…"
+
+def _digest_key(responses):
+    """Content hash identifying a run of responses."""
+    digest = hashlib.sha256()
+    for response in responses:
+        digest.update(response.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def _cached_digest(key):
+    with _digest_lock:
+        if key in _digest_cache:
+            _digest_cache.move_to_end(key)
+            return _digest_cache[key]
+    return None
+
+def _store_digest(key, digest):
+    with _digest_lock:
+        _digest_cache[key] = digest
+        _digest_cache.move_to_end(key)
+        while len(_digest_cache) > DIGEST_CACHE_SIZE:
+            _digest_cache.popitem(last=False)
+
+def _extractive_digest(previous_digest, first_number, responses):
+    """Digest without an LLM: the previous digest plus the start of each new response."""
+    excerpts = [
+        f"Response {number}: {clip_to_tokens(response.strip(), 60)}"
+        for number, response in enumerate(responses, first_number)
+    ]
+    return "\n".join(([previous_digest] if previous_digest else []) + excerpts)
+
+def rolling_digest(responses, fold):
+    """
+    Digest of responses, extending the longest already-digested run.
+
+    All responses not yet digested are folded in with a single call. If
+    that fails, an extractive digest is used for this prompt but not
+    cached, so the next prompt tries the fold again.
+
+    Args:
+        responses: Responses to digest, oldest first
+        fold: Callable (previous_digest, first_number, new_responses) ->
+            digest, or None if it failed
+
+    Returns:
+        Digest text
+    """
+    # Find the longest prefix of responses that has already been digested
+    digest = ""
+    start = 0
+    for end in range(len(responses), 0, -1):
+        cached = _cached_digest(_digest_key(responses[:end]))
+        if cached is not None:
+            digest, start = cached, end
+            break
+    if start == len(responses):
+        return digest
+
+    folded = fold(digest, start + 1, responses[start:])
+    if folded is None:
+        return _extractive_digest(digest, start + 1, responses[start:])
+    _store_digest(_digest_key(responses), folded)
+    return folded
+
+def fit_responses(responses, base_tokens, fold, budget=None):
+    """
+    Choose how much response history fits in a prompt.
+
+    Every response is first clipped to the per-answer limit. The newest
+    responses are kept verbatim while they fit within the budget; older
+    ones are replaced by a rolling digest.
+
+    Args:
+        responses: All previous responses, oldest first
+        base_tokens: Tokens used by the rest of the prompt
+        fold: Callable used to extend the digest, see rolling_digest
+        budget: Prompt token budget, defaults to the configured one
+
+    Returns:
+        Tuple of (digest, recent_responses, first_recent_number); digest is
+        None when the full history fits
+    """
+    if budget is None:
+        budget = get_setting('openai', 'context_token_budget', 6000)
+    max_answer_tokens = get_setting('openai', 'max_answer_tokens', 1500)
+    digest_tokens = get_setting('openai', 'digest_token_budget', 400)
+
+    responses = [clip_to_tokens(response, max_answer_tokens) for response in responses]
+    costs = [count_tokens(response) + 2 * MESSAGE_OVERHEAD_TOKENS for response in responses]
+
+    if base_tokens + sum(costs) <= budget:
+        return None, responses, 1
+
+    # Keep the newest responses that fit alongside a digest of the rest
+    available = budget - base_tokens - digest_tokens - MESSAGE_OVERHEAD_TOKENS
+    keep_from = len(responses)
+    while keep_from > 0 and costs[keep_from - 1] <= available:
+        available -= costs[keep_from - 1]
+        keep_from -= 1
+
+    digest = clip_to_tokens(rolling_digest(responses[:keep_from], fold), digest_tokens)
+    return digest, responses[keep_from:], keep_from + 1
@@ -0,0 +1,353 @@
+"""
+Export users, responses, ratings and sessions to Parquet for offline analytics.
+
+Each collection is read through the configured storage driver (Firestore
+or SQLite) in timestamp order, a page at a time, and written as
+Hive-partitioned Parquet under the output directory:
+
+    <output>/responses/topic=<topic>/date=<YYYY-MM-DD>/part-<run>.parquet
+    <output>/ratings/topic=<topic>/date=<YYYY-MM-DD>/part-<run>.parquet
+    <output>/users/date=<YYYY-MM-DD>/part-<run>.parquet
+    <output>/sessions/topic=<topic>/date=<YYYY-MM-DD>/part-<run>.parquet
+
+Responses are flattened to one row per question and answer (any schema
+version, via decode_response). Users are exported without their names.
+Sessions are the in-progress checkpoints, reduced to the stage reached
+and the number of answers; since a checkpoint changes as the session goes
+on, each run adds a new row for every session updated since the last.
+Rows are buffered per partition and written as row groups, so memory is
+bounded by the page size and row group size, not the collection size.
+
+Runs are incremental: the latest exported completed_at/created_at/updated_at per
+collection is saved in <output>/_export_state.json and the next run only
+reads newer documents. Documents younger than --lag seconds are left for
+the next run, so writes still waiting in an app's write-behind queue with
+an older timestamp aren't skipped. Files are written under temporary
+names and renamed, and the watermark saved, only once a collection has
+been exported completely, so an interrupted run can simply be re-run.
+
+Usage:
+    python export_analytics.py --output analytics
+    python export_analytics.py --output analytics --collections responses ratings --full
+"""
+
+import argparse
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
+from firebase_utils import decode_response
+from storage import get_storage
+
+STATE_FILE = "_export_state.json"
+
+def _users_rows(data):
+    yield {
+        'user_id': data.get('user_id'),
+        'age': data.get('age'),
+        'gender': data.get('gender'),
+        'relationship_status': data.get('relationship_status'),
+        'created_at': data.get('created_at')
+    }
+
+def _responses_rows(data):
+    response = decode_response(data)
+    for pair in response['qa_pairs']:
+        yield {
+            'topic': response.get('topic'),
+            'response_id': response.get('response_id'),
+            'user_id': response.get('user_id'),
+            'schema_version': response['schema_version'],
+            'question_count': len(response['qa_pairs']),
+            'question_number': pair['question_number'],
+            'question': pair['question'],
+            'response': pair['response'],
+            'completed_at': response.get('completed_at')
+        }
+
+def _ratings_rows(data):
+    yield {
+        'topic': data.get('topic'),
+        'rating_id': data.get('rating_id'),
+        'user_id': data.get('user_id'),
+        'informative_rating': data.get('informative_rating'),
+        'engaging_rating': data.get('engaging_rating'),
+        'repeat_rating': data.get('repeat_rating'),
+        # Fall back to the old single rating field
+        'overall_rating': data.get('overall_rating', data.get('rating')),
+        'feedback': data.get('feedback'),
+        'created_at': data.get('created_at')
+    }
+
+def _sessions_rows(data):
+    responses = data.get('responses') or {}
+    yield {
+        'topic': data.get('topic'),
+        'session_id': data.get('session_id'),
+        'user_id': data.get('user_id'),
+        'stage': data.get('stage'),
+        'current_question': data.get('current_question'),
+        'questions_generated': len(data.get('questions') or {}),
+        'answers': sum(1 for text in responses.values() if text and text.strip()),
+        'updated_at': data.get('updated_at')
+    }
+
+# Per exported table (storage.EXPORT_TABLES): watermark field, partition
+# columns (stored in the path, not the file), row builder and file schema
+EXPORTS = {
+    'users': {
+        'timestamp_field': 'created_at',
+        'partition_by': [],
+        'rows': _users_rows,
+        'schema': pa.schema([
+            ('user_id', pa.string()),
+            ('age', pa.int32()),
+            ('gender', pa.string()),
+            ('relationship_status', pa.string()),
+            ('created_at', pa.timestamp('us', tz='UTC'))
+        ])
+    },
+    'responses': {
+        'timestamp_field': 'completed_at',
+        'partition_by': ['topic'],
+        'rows': _responses_rows,
+        'schema': pa.schema([
+            ('response_id', pa.string()),
+            ('user_id', pa.string()),
+            ('schema_version', pa.int8()),
+            ('question_count', pa.int16()),
+            ('question_number', pa.int16()),
+            ('question', pa.string()),
+            ('response', pa.string()),
+            ('completed_at', pa.timestamp('us', tz='UTC'))
+        ])
+    },
+    'ratings': {
+        'timestamp_field': 'created_at',
+        'partition_by': ['topic'],
+        'rows': _ratings_rows,
+        'schema': pa.schema([
+            ('rating_id', pa.string()),
+            ('user_id', pa.string()),
+            ('informative_rating', pa.int8()),
+            ('engaging_rating', pa.int8()),
+            ('repeat_rating', pa.int8()),
+            ('overall_rating', pa.float32()),
+            ('feedback', pa.string()),
+            ('created_at', pa.timestamp('us', tz='UTC'))
+        ])
+    },
+    'sessions': {
+        'timestamp_field': 'updated_at',
+        'partition_by': ['topic'],
+        'rows': _sessions_rows,
+        'schema': pa.schema([
+            ('session_id', pa.string()),
+            ('user_id', pa.string()),
+            ('stage', pa.string()),
+            ('current_question', pa.int16()),
+            ('questions_generated', pa.int16()),
+            ('answers', pa.int16()),
+            ('updated_at', pa.timestamp('us', tz='UTC'))
+        ])
+    }
+}
+
+def _as_utc(value):
+    """Timestamps as aware UTC datetimes; naive ones (as Firestore treats them) are UTC."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def _as_query_time(value):
+    """Naive UTC datetime for query bounds, which Firestore reads as UTC."""
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value is not None else None
+
+def load_state(output):
+    """Watermarks and counts per exported table from the last runs."""
+    path = os.path.join(output, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_state(output, state):
+    # Write then rename, so an interrupted run never leaves a torn state file
+    path = os.path.join(output, STATE_FILE)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, path)
+
+class PartitionedWriter:
+    """Buffers rows per partition and writes them as Parquet row groups."""
+
+    def __init__(self, root, schema, partition_by, run_id, row_group_size=50000, max_buffered_rows=200000):
+        """
+        Args:
+            root: Directory of the exported table
+            schema: Schema of the files (without the partition columns)
+            partition_by: Partition column names, before the date
+            run_id: Suffix of this run's file names
+            row_group_size: Rows per partition buffered before a row group is written
+            max_buffered_rows: Rows buffered across partitions before all are written
+        """
+        self.root = root
+        self.schema = schema
+        self.partition_by = partition_by
+        self.run_id = run_id
+        self.row_group_size = row_group_size
+        self.max_buffered_rows = max_buffered_rows
+        self.rows_written = 0
+        self._buffers = {}
+        self._buffered = 0
+        self._writers = {}
+
+    def add(self, partition, row):
+        """Buffer a row for a partition (a tuple of partition values, date last)."""
+        buffer = self._buffers.setdefault(partition, {name: [] for name in self.schema.names})
+        for name in self.schema.names:
+            buffer[name].append(row.get(name))
+        self._buffered += 1
+        if len(buffer[self.schema.names[0]]) >= self.row_group_size:
+            self._flush(partition)
+        elif self._buffered >= self.max_buffered_rows:
+            for buffered_partition in list(self._buffers):
+                self._flush(buffered_partition)
+
+    def close(self):
+        """
+        Write the remaining rows and rename the files to their final names.
+
+        Returns:
+            List of the files written
+        """
+        for partition in list(self._buffers):
+            self._flush(partition)
+        paths = []
+        for temp_path, writer in self._writers.values():
+            writer.close()
+            path = temp_path[:-len(".tmp")]
+            os.replace(temp_path, path)
+            paths.append(path)
+        self._writers = {}
+        return paths
+
+    def abort(self):
+        """Discard everything written so far."""
+        for temp_path, writer in self._writers.values():
+            writer.close()
+            os.remove(temp_path)
+        self._writers = {}
+        self._buffers = {}
+
+    def _flush(self, partition):
+        buffer = self._buffers.pop(partition)
+        table = pa.table(buffer, schema=self.schema)
+        self._buffered -= table.num_rows
+        if partition not in self._writers:
+            directory = os.path.join(self.root, *(
+                f"{name}={value}" for name, value in zip(self.partition_by + ['date'], partition)
+            ))
+            os.makedirs(directory, exist_ok=True)
+            temp_path = os.path.join(directory, f"part-{self.run_id}.parquet.tmp")
+            self._writers[partition] = (temp_path, pq.ParquetWriter(temp_path, self.schema, compression='zstd'))
+        self._writers[partition][1].write_table(table)
+        self.rows_written += table.num_rows
+
+def _existing_files(root):
+    return [
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(root)
+        for name in names if name.endswith(".parquet")
+    ]
+
+def export_table(table_name, output, state, full=False, lag=300, page_size=500, row_group_size=50000):
+    """
+    Export one table's new documents, updating its watermark in state.
+
+    Args:
+        table_name: Key of EXPORTS
+        output: Output directory
+        state: State dictionary from load_state, updated in place
+        full: Ignore the watermark and replace the table's existing files
+        lag: Seconds before now after which documents are left for the next run
+        page_size: Documents read per page
+        row_group_size: Rows per Parquet row group
+
+    Returns:
+        Dictionary with documents and rows exported, files written and the new watermark
+    """
+    export = EXPORTS[table_name]
+    root = os.path.join(output, table_name)
+    previous = state.get(table_name, {})
+    watermark = None if full else previous.get('watermark')
+    after = datetime.fromisoformat(watermark) if watermark else None
+    until = datetime.now(timezone.utc) - timedelta(seconds=lag)
+    replaced = _existing_files(root) if full else []
+
+    writer = PartitionedWriter(root, export['schema'], export['partition_by'],
+                               f"{until:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}", row_group_size)
+    documents = 0
+    latest = after
+    try:
+        for page in get_storage().iter_documents_since(table_name, export['timestamp_field'],
+                                                       _as_query_time(after), _as_query_time(until), page_size):
+            for data in page:
+                timestamp = _as_utc(data.get(export['timestamp_field']))
+                data[export['timestamp_field']] = timestamp
+                date = timestamp.strftime("%Y-%m-%d")
+                for row in export['rows'](data):
+                    partition = tuple(row.get(name) or "unknown" for name in export['partition_by']) + (date,)
+                    writer.add(partition, row)
+                latest = timestamp if latest is None else max(latest, timestamp)
+                documents += 1
+    except BaseException:
+        writer.abort()
+        raise
+    files = writer.close()
+
+    for path in replaced:
+        os.remove(path)
+    state[table_name] = {
+        'watermark': latest.isoformat() if latest else watermark,
+        'documents': (0 if full else previous.get('documents', 0)) + documents,
+        'rows': (0 if full else previous.get('rows', 0)) + writer.rows_written,
+        'exported_at': datetime.now(timezone.utc).isoformat()
+    }
+    _save_state(output, state)
+    return {
+        'documents': documents,
+        'rows': writer.rows_written,
+        'files': files,
+        'watermark': state[table_name]['watermark']
+    }
+
+def main():
+    """Export the requested tables, printing a line per table."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="analytics", help="Directory to write the Parquet tables to")
+    parser.add_argument("--collections", nargs="+", choices=list(EXPORTS), default=list(EXPORTS),
+                        help="Tables to export")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the watermarks and replace the existing files")
+    parser.add_argument("--lag", type=float, default=300,
+                        help="Leave documents younger than this many seconds for the next run")
+    parser.add_argument("--page-size", type=int, default=500, help="Documents read per page")
+    parser.add_argument("--row-group-size", type=int, default=50000, help="Rows per Parquet row group")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    state = load_state(args.output)
+    for table_name in args.collections:
+        result = export_table(table_name, args.output, state, full=args.full, lag=args.lag,
+                              page_size=args.page_size, row_group_size=args.row_group_size)
+        print(f"{table_name}: {result['documents']} documents, {result['rows']} rows in "
+              f"{len(result['files'])} file(s); watermark {result['watermark'] or 'none'}")
+
+if __name__ == "__main__":
+    main()
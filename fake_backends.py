@@ -0,0 +1,429 @@
+"""
+In-process stand-ins for OpenAI and Firestore used by load tests.
+
+Enable them with the environment variable DDMVT_FAKE_BACKENDS=1 (or
+[app] fake_backends = true in secrets). get_db() then returns an in-memory
+Firestore and initialize_openai() a stub client, both shared by every
+session in the process. Latency distributions and error rates are set
+with configure(); call counts are available from get_call_counts().
+"""
+
+import copy
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+import httpx
+import openai
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+_settings = {
+    # LLM latency is log-normal around the median, in seconds
+    'llm_latency_median': 1.5,
+    'llm_latency_sigma': 0.5,
+    'llm_first_token_median': 0.4,
+    'llm_chunk_delay': 0.01,
+    'llm_error_rate': 0.0,
+    'llm_rate_limit_rate': 0.0,
+    # Per-model latency multipliers, e.g. {'gpt-5': 3.0} for a slow primary
+    'llm_model_latency_scale': {},
+    # Firestore latency per operation, in seconds
+    'db_latency_median': 0.03,
+    'db_latency_sigma': 0.3,
+    'db_error_rate': 0.0,
+}
+
+_call_counts = Counter()
+_counts_lock = threading.Lock()
+
+def configure(**settings):
+    """Update latency and error settings, e.g. configure(llm_latency_median=2.0)."""
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise ValueError(f"Unknown fake backend settings: {', '.join(sorted(unknown))}")
+    _settings.update(settings)
+
+def get_call_counts():
+    """Get the number of calls made to each fake backend operation."""
+    with _counts_lock:
+        return dict(_call_counts)
+
+def reset_call_counts():
+    """Reset the call counters."""
+    with _counts_lock:
+        _call_counts.clear()
+
+def _count(name):
+    with _counts_lock:
+        _call_counts[name] += 1
+
+def _sample_latency(median, sigma):
+    """Sample a log-normal latency with the given median in seconds."""
+    if median <= 0:
+        return 0.0
+    return random.lognormvariate(math.log(median), sigma)
+
+# --- OpenAI -------------------------------------------------------------
+
+_FAKE_QUESTIONS = [
+    "Think of a recent moment when you felt really close to your partner. What was happening?",
+    "When that happened, what did you notice about how you each responded?",
+    "What do you think that moment says about what matters most to you?",
+    "How does this show up in your day-to-day life together?",
+    "If you could change one small thing about this pattern, what would it be?",
+]
+
+def _fake_error(status_code):
+    """Build the OpenAI error the real client would raise for a status code."""
+    request = httpx.Request("POST", "https://fake.openai.local/v1/chat/completions")
+    response = httpx.Response(status_code, request=request)
+    if status_code == 429:
+        return openai.RateLimitError("Fake rate limit", response=response, body=None)
+    return openai.InternalServerError("Fake server error", response=response, body=None)
+
+def _fake_usage(messages, text):
+    prompt_tokens = sum(len(message["content"]) // 4 + 4 for message in messages)
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=len(text) // 4,
+        total_tokens=prompt_tokens + len(text) // 4,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=0),
+        completion_tokens_details=SimpleNamespace(reasoning_tokens=0)
+    )
+
+def _fake_content(messages, response_format):
+    """Canned content shaped like what the app asks for."""
+    if response_format:
+        return json.dumps({
+            "insights": "• You notice small moments of care\n• You value being heard\n• Naming needs early helps you both",
+            "summary": "You reflected on what brings you closer and what gets in the way.\n\nThere is real care in how you describe your relationship."
+        })
+    return random.choice(_FAKE_QUESTIONS)
+
+def _latency_scale(model):
+    return _settings['llm_model_latency_scale'].get(model, 1.0)
+
+class FakeStream:
+    """Iterable of chat completion chunks, closable like the SDK's Stream."""
+
+    def __init__(self, content, usage, latency_scale=1.0):
+        self._content = content
+        self._usage = usage
+        self._latency_scale = latency_scale
+        self.closed = False
+
+    def __iter__(self):
+        time.sleep(self._latency_scale * _sample_latency(_settings['llm_first_token_median'], _settings['llm_latency_sigma']))
+        for word in self._content.split(" "):
+            if self.closed:
+                return
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))],
+                usage=None
+            )
+            time.sleep(_settings['llm_chunk_delay'])
+        yield SimpleNamespace(choices=[], usage=self._usage)
+
+    def close(self):
+        self.closed = True
+
+class _FakeCompletions:
+    def create(self, model, messages, stream=False, response_format=None, **kwargs):
+        _count('openai.chat.completions.create')
+        roll = random.random()
+        if roll < _settings['llm_rate_limit_rate']:
+            raise _fake_error(429)
+        if roll < _settings['llm_rate_limit_rate'] + _settings['llm_error_rate']:
+            time.sleep(_latency_scale(model) * _sample_latency(_settings['llm_latency_median'], _settings['llm_latency_sigma']))
+            raise _fake_error(500)
+
+        content = _fake_content(messages, response_format)
+        usage = _fake_usage(messages, content)
+        if stream:
+            return FakeStream(content, usage, _latency_scale(model))
+
+        time.sleep(_latency_scale(model) * _sample_latency(_settings['llm_latency_median'], _settings['llm_latency_sigma']))
+        return SimpleNamespace(
+            id=f"fake-{uuid.uuid4()}",
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+            usage=usage
+        )
+
+class FakeOpenAI:
+    """Stub with the slice of the openai.OpenAI interface the app uses."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=_FakeCompletions())
+
+# --- Firestore ----------------------------------------------------------
+
+def _db_call(name):
+    """Count a Firestore operation and simulate its latency and errors."""
+    _count(f'firestore.{name}')
+    time.sleep(_sample_latency(_settings['db_latency_median'], _settings['db_latency_sigma']))
+    if random.random() < _settings['db_error_rate']:
+        raise RuntimeError(f"Fake Firestore error during {name}")
+
+def _apply_value(target, field, value):
+    """Set a (possibly dotted) field, applying Increment transforms."""
+    *parents, leaf = field.split(".")
+    for parent in parents:
+        target = target.setdefault(parent, {})
+    if isinstance(value, firestore.Increment):
+        target[leaf] = target.get(leaf, 0) + value.value
+    elif value is firestore.DELETE_FIELD:
+        target.pop(leaf, None)
+    elif value is firestore.SERVER_TIMESTAMP:
+        target[leaf] = datetime.now()
+    else:
+        target[leaf] = copy.deepcopy(value)
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        value = self._data
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+
+class FakeDocumentReference:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def _write(self, data, merge):
+        collection, doc_id = self.path.rsplit("/", 1)
+        with self._db._lock:
+            docs = self._db._collections.setdefault(collection, {})
+            target = docs.get(doc_id, {}) if merge else {}
+            target = copy.deepcopy(target)
+            for field, value in data.items():
+                if merge and isinstance(value, dict) and isinstance(target.get(field), dict):
+                    # Merge nested maps like Firestore's merge=True
+                    for key, nested in value.items():
+                        _apply_value(target[field], key, nested)
+                else:
+                    _apply_value(target, field, value)
+            docs[doc_id] = target
+
+    def _update(self, data):
+        collection, doc_id = self.path.rsplit("/", 1)
+        with self._db._lock:
+            docs = self._db._collections.setdefault(collection, {})
+            if doc_id not in docs:
+                raise KeyError(f"No document to update: {self.path}")
+            target = copy.deepcopy(docs[doc_id])
+            for field, value in data.items():
+                _apply_value(target, field, value)
+            docs[doc_id] = target
+
+    def set(self, data, merge=False):
+        _db_call('set')
+        self._write(data, merge)
+
+    def update(self, data):
+        _db_call('update')
+        self._update(data)
+
+    def delete(self):
+        _db_call('delete')
+        collection, doc_id = self.path.rsplit("/", 1)
+        with self._db._lock:
+            self._db._collections.get(collection, {}).pop(doc_id, None)
+
+    def get(self, field_paths=None):
+        _db_call('get')
+        return self._db._snapshot(self, field_paths)
+
+_OPERATORS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+class FakeQuery:
+    def __init__(self, db, path, filters=(), orders=(), limit=None, fields=None, cursor=None):
+        self._db = db
+        self._path = path
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._fields = fields
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                     fields=self._fields, cursor=self._cursor)
+        state.update(changes)
+        return FakeQuery(self._db, self._path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def _run(self):
+        with self._db._lock:
+            docs = [(doc_id, copy.deepcopy(data)) for doc_id, data in self._db._collections.get(self._path, {}).items()]
+
+        def field(data, path):
+            snapshot = FakeSnapshot(FakeDocumentReference(self._db, f"{self._path}/x"), data)
+            return snapshot.get(path)
+
+        for path, op, value in self._filters:
+            docs = [(doc_id, data) for doc_id, data in docs if _OPERATORS[op](field(data, path), value)]
+
+        orders = self._orders or [("__name__", "ASCENDING")]
+        for path, direction in reversed(orders):
+            def sort_key(item, path=path):
+                value = item[0] if path == "__name__" else field(item[1], path)
+                return (value is not None, value)
+            docs.sort(key=sort_key, reverse=direction == "DESCENDING")
+
+        if self._cursor is not None:
+            cursor = self._cursor
+            if isinstance(cursor, FakeSnapshot):
+                cursor_id, cursor_data = cursor.id, cursor._data
+            else:
+                cursor_id, cursor_data = cursor.get("__name__"), cursor
+            for index, (doc_id, data) in enumerate(docs):
+                if doc_id == cursor_id or (cursor_id is None and all(
+                        field(data, path) == cursor_data.get(path) for path, _ in orders)):
+                    docs = docs[index + 1:]
+                    break
+
+        if self._limit is not None:
+            docs = docs[:self._limit]
+
+        snapshots = []
+        for doc_id, data in docs:
+            if self._fields is not None:
+                data = {path: field(data, path) for path in self._fields if field(data, path) is not None}
+            snapshots.append(FakeSnapshot(FakeDocumentReference(self._db, f"{self._path}/{doc_id}"), data))
+        return snapshots
+
+    def get(self):
+        _db_call('query')
+        return self._run()
+
+    def stream(self):
+        _db_call('query')
+        yield from self._run()
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, path):
+        super().__init__(db, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id=None):
+        return FakeDocumentReference(self._db, f"{self._path}/{document_id or uuid.uuid4().hex}")
+
+class FakeWriteBatch:
+    """Applies all staged writes at once on commit."""
+
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(('set', reference, data, merge))
+
+    def create(self, reference, data):
+        self._writes.append(('create', reference, data, False))
+
+    def update(self, reference, data):
+        self._writes.append(('update', reference, data, None))
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference, None, None))
+
+    def commit(self):
+        _db_call('batch_commit')
+        with self._db._commit_lock:
+            for kind, reference, data, merge in self._writes:
+                if kind == 'create' and self._db._snapshot(reference).exists:
+                    raise AlreadyExists(f"Document already exists: {reference.path}")
+            for kind, reference, data, merge in self._writes:
+                if kind in ('set', 'create'):
+                    reference._write(data, merge)
+                elif kind == 'update':
+                    reference._update(data)
+                else:
+                    with self._db._lock:
+                        collection, doc_id = reference.path.rsplit("/", 1)
+                        self._db._collections.get(collection, {}).pop(doc_id, None)
+        self._writes = []
+
+class FakeFirestore:
+    """In-memory stand-in for google.cloud.firestore.Client."""
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.RLock()
+        self._commit_lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references, field_paths=None):
+        _db_call('get_all')
+        for reference in references:
+            yield self._snapshot(reference, field_paths)
+
+    def _snapshot(self, reference, field_paths=None):
+        collection, doc_id = reference.path.rsplit("/", 1)
+        with self._lock:
+            data = copy.deepcopy(self._collections.get(collection, {}).get(doc_id))
+        if data is not None and field_paths is not None:
+            data = {path: data[path] for path in field_paths if path in data}
+        return FakeSnapshot(reference, data)
+
+_fake_db = FakeFirestore()
+_fake_openai = FakeOpenAI()
+
+def get_fake_db():
+    """Get the process-wide in-memory Firestore."""
+    return _fake_db
+
+def get_fake_openai():
+    """Get the process-wide OpenAI stub."""
+    return _fake_openai
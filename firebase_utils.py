@@ -1,16 +1,237 @@
 """
-Firebase Firestore utilities for the Relationship Reflection App.
+Data functions and the Firestore storage driver for the Relationship Reflection App.
+
+The public functions build the app's documents and hand them to the
+storage driver selected in config (see storage.py); FirestoreStorage is
+the Firestore driver. Backfills and migrations below work on Firestore
+directly.
 """
 
+import json
+import logging
+import os
+import random
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from config import get_db
+from config import get_db, get_setting, use_fake_backends
+from persistence_queue import PersistenceQueue, QueueFull
+from questions import get_topic_list
+from storage import StorageBackend, get_storage, summarize_topic_counts
 import streamlit as st
 
+logger = logging.getLogger(__name__)
+
+# Per-topic aggregates are spread over a few shard documents so concurrent
+# completions of the same topic don't contend on a single document.
+TOPIC_STATS_COLLECTION = 'streamlitTopicStats'
+TOPIC_STATS_SHARDS = 5
+
+# How long topic stats are shared across sessions before being re-read
+STATS_CACHE_TTL = get_setting('app', 'stats_cache_ttl', 300)
+
+USERS_COLLECTION = 'streamlitUsers'
+RESPONSES_COLLECTION = 'streamlitResponses'
+RATINGS_COLLECTION = 'streamlitRatings'
+
+# v2 response documents store each question and answer once, in qa_pairs;
+# v1 documents (no schema_version) also repeat them in questions/responses
+RESPONSE_SCHEMA_VERSION = 2
+
+# Fields the history list needs; full transcripts are fetched on demand
+HISTORY_FIELDS = ['response_id', 'topic', 'completed_at']
+
+# Writes per batch when migrating response documents
+MIGRATION_BATCH_SIZE = 100
+
+# In-progress sessions are checkpointed here so they can be resumed
+SESSIONS_COLLECTION = 'streamlitSessions'
+
+# One marker per applied session_results job, created in the same batch as
+# its counter increments so a retried or replayed job can't count twice
+APPLIED_JOBS_COLLECTION = 'streamlitAppliedJobs'
+
+# Collection behind each of storage.EXPORT_TABLES
+EXPORT_COLLECTIONS = {
+    'users': USERS_COLLECTION,
+    'responses': RESPONSES_COLLECTION,
+    'ratings': RATINGS_COLLECTION,
+    'sessions': SESSIONS_COLLECTION
+}
+
+EMPTY_TOPIC_STATS = {'response_count': 0, 'avg_rating': 0, 'rating_count': 0}
+
+def _topic_stats_shard(db, topic):
+    """Return a randomly chosen stats shard document for a topic."""
+    shard = random.randrange(TOPIC_STATS_SHARDS)
+    return db.collection(TOPIC_STATS_COLLECTION).document(f"{topic}_{shard}"), shard
+
+def _stage_job(batch, db, job):
+    """Add the writes for a persistence job to a write batch."""
+    if job['kind'] == 'user_profile':
+        user_data = job['user']
+        batch.set(db.collection(USERS_COLLECTION).document(user_data['user_id']), user_data)
+    elif job['kind'] == 'session_results':
+        response_data = job.get('response')
+        rating_data = job.get('rating')
+        if response_data is not None:
+            batch.set(db.collection(RESPONSES_COLLECTION).document(response_data['response_id']), response_data)
+        if rating_data is not None:
+            batch.set(db.collection(RATINGS_COLLECTION).document(rating_data['rating_id']), rating_data)
+        topic = (response_data or rating_data)['topic']
+        _stage_topic_stats(batch, db, topic, response_data=response_data, rating_data=rating_data)
+        # create() fails the whole batch if the marker exists, i.e. the job was already applied
+        batch.create(db.collection(APPLIED_JOBS_COLLECTION).document(job['job_id']), {
+            'job_id': job['job_id'],
+            'applied_at': datetime.now()
+        })
+    elif job['kind'] == 'session_checkpoint':
+        # Field-level merge: only the fields in the checkpoint are written
+        fields = dict(job['fields'])
+        if job.get('reset'):
+            from firebase_admin import firestore
+            fields.update(questions=firestore.DELETE_FIELD, responses=firestore.DELETE_FIELD)
+        batch.set(db.collection(SESSIONS_COLLECTION).document(job['session_id']), fields, merge=True)
+    else:
+        raise ValueError(f"Unknown persistence job kind: {job['kind']}")
+
+def _is_already_applied(error):
+    """Whether a commit failed because a job's applied marker already exists."""
+    from google.api_core.exceptions import AlreadyExists
+    return isinstance(error, AlreadyExists)
+
+def _on_jobs_flushed(jobs):
+    """Invalidate cached topic stats once new results are committed."""
+    if any(job['kind'] == 'session_results' for job in jobs):
+        _fetch_all_topic_stats.clear()
+
+def _spill_path():
+    """Spill file base path; fake-backend runs journal separately so they never replay into Firestore."""
+    path = get_setting('persistence', 'spill_path', '.persistence_spill.jsonl')
+    if use_fake_backends():
+        root, ext = os.path.splitext(path)
+        path = f"{root}_fake{ext}"
+    return path
+
+@st.cache_resource
+def get_persistence_queue():
+    """Get the process-wide write-behind queue, starting its worker on first use."""
+    return PersistenceQueue(
+        get_db=get_db,
+        stage_job=_stage_job,
+        on_flush=_on_jobs_flushed,
+        already_applied=_is_already_applied,
+        spill_path=_spill_path(),
+        max_size=get_setting('persistence', 'max_queue_size', 1000),
+        batch_size=get_setting('persistence', 'batch_size', 100),
+        flush_interval=get_setting('persistence', 'flush_interval', 0.2),
+        max_retries=get_setting('persistence', 'max_retries', 8),
+        retry_base_delay=get_setting('persistence', 'retry_base_delay', 0.5),
+        retry_max_delay=get_setting('persistence', 'retry_max_delay', 30)
+    ).start()
+
+def _persist(job):
+    """
+    Persist a job's writes.
+    
+    With write-behind enabled (the default) the job is queued and this
+    returns immediately. It is written synchronously when write-behind is
+    disabled or the queue is full.
+    """
+    job = dict(job, job_id=str(uuid.uuid4()))
+    if get_setting('persistence', 'write_behind', True):
+        try:
+            get_persistence_queue().enqueue(job)
+            return
+        except QueueFull:
+            logger.warning("Persistence queue full, writing synchronously")
+    
+    db = get_db()
+    batch = db.batch()
+    _stage_job(batch, db, job)
+    batch.commit()
+    _on_jobs_flushed([job])
+
+class FirestoreStorage(StorageBackend):
+    """Cloud Firestore driver; writes go through the write-behind queue."""
+    
+    def warm_up(self):
+        # A one-document read opens the gRPC channel
+        get_db().collection(TOPIC_STATS_COLLECTION).limit(1).get()
+    
+    def save_user_profile(self, user_data):
+        _persist({'kind': 'user_profile', 'user': user_data})
+    
+    def save_session_results(self, response_data=None, rating_data=None):
+        job = {'kind': 'session_results'}
+        if response_data is not None:
+            job['response'] = response_data
+        if rating_data is not None:
+            job['rating'] = rating_data
+        _persist(job)
+    
+    def get_user_responses_page(self, user_id, page_size=20, start_after=None, fields=None, descending=True):
+        # Needs a composite index on user_id and completed_at
+        db = get_db()
+        query = db.collection(RESPONSES_COLLECTION).where('user_id', '==', user_id).order_by(
+            'completed_at', direction='DESCENDING' if descending else 'ASCENDING'
+        ).limit(page_size)
+        if fields:
+            query = query.select(fields)
+        if start_after is not None:
+            query = query.start_after(start_after)
+        
+        docs = query.get()
+        next_cursor = docs[-1] if len(docs) == page_size else None
+        return [doc.to_dict() for doc in docs], next_cursor
+    
+    def get_response(self, response_id):
+        doc = get_db().collection(RESPONSES_COLLECTION).document(response_id).get()
+        return doc.to_dict() if doc.exists else None
+    
+    def get_topic_stats(self, topic):
+        shards = get_db().collection(TOPIC_STATS_COLLECTION).where('topic', '==', topic).get()
+        return _summarize_topic_shards(doc.to_dict() for doc in shards)
+    
+    def get_all_topic_stats(self):
+        return _fetch_all_topic_stats()
+    
+    def save_session_checkpoint(self, session_id, fields, reset=False):
+        _persist({'kind': 'session_checkpoint', 'session_id': session_id, 'fields': fields, 'reset': reset})
+    
+    def load_session_checkpoint(self, session_id):
+        # Checkpoints from this process may still be queued
+        self.wait_until_idle(get_setting('persistence', 'resume_wait', 2))
+        doc = get_db().collection(SESSIONS_COLLECTION).document(session_id).get()
+        return doc.to_dict() if doc.exists else None
+    
+    def wait_until_idle(self, timeout=None):
+        if not get_setting('persistence', 'write_behind', True):
+            return True
+        return get_persistence_queue().wait_until_idle(timeout)
+    
+    def iter_documents_since(self, table, timestamp_field, after=None, until=None, page_size=500):
+        # Pages are read with a cursor on the last document; documents
+        # without the timestamp field are not returned
+        query = get_db().collection(EXPORT_COLLECTIONS[table])
+        if after is not None:
+            query = query.where(timestamp_field, '>', after)
+        if until is not None:
+            query = query.where(timestamp_field, '<=', until)
+        query = query.order_by(timestamp_field).order_by('__name__').limit(page_size)
+        
+        cursor = None
+        while True:
+            docs = (query.start_after(cursor) if cursor is not None else query).get()
+            if docs:
+                yield [doc.to_dict() for doc in docs]
+            if len(docs) < page_size:
+                return
+            cursor = docs[-1]
+
 def save_user_profile(name, age, gender, relationship_status):
-    """Save user profile to Firestore and return user_id."""
+    """Save user profile and return user_id."""
     try:
-        db = get_db()
         user_id = str(uuid.uuid4())
         
         user_data = {
@@ -22,104 +243,436 @@ def save_user_profile(name, age, gender, relationship_status):
             'created_at': datetime.now()
         }
         
-        db.collection('streamlitUsers').document(user_id).set(user_data)
+        get_storage().save_user_profile(user_data)
         return user_id
     except Exception as e:
         st.error(f"Error saving user profile: {str(e)}")
         return None
 
+def _build_response_data(response_id, user_id, topic, questions, responses):
+    """Build the (v2) streamlitResponses document for a completed session."""
+    return {
+        'schema_version': RESPONSE_SCHEMA_VERSION,
+        'response_id': response_id,
+        'user_id': user_id,
+        'topic': topic,
+        # Question numbers are implied by position
+        'qa_pairs': [
+            {'question': question, 'response': response}
+            for question, response in zip(questions, responses)
+        ],
+        'completed_at': datetime.now()
+    }
+
+def decode_response(data):
+    """
+    Decode a streamlitResponses document of any schema version.
+    
+    Returns:
+        Dictionary with numbered qa_pairs plus questions and responses
+        lists, whichever version the document was stored in
+    """
+    data = dict(data)
+    version = data.get('schema_version', 1)
+    if version >= 2:
+        qa_pairs = data.get('qa_pairs', [])
+    elif data.get('qa_pairs'):
+        qa_pairs = data['qa_pairs']
+    else:
+        # The earliest documents only have the parallel lists
+        qa_pairs = [
+            {'question': question, 'response': response}
+            for question, response in zip(data.get('questions', []), data.get('responses', []))
+        ]
+    
+    data['schema_version'] = version
+    data['qa_pairs'] = [
+        {
+            'question_number': i,
+            'question': pair.get('question', ""),
+            'response': pair.get('response', "")
+        }
+        for i, pair in enumerate(qa_pairs, 1)
+    ]
+    data['questions'] = [pair['question'] for pair in data['qa_pairs']]
+    data['responses'] = [pair['response'] for pair in data['qa_pairs']]
+    return data
+
+def _encode_response_v2(data):
+    """Rewrite a response document of any version as a v2 document."""
+    decoded = decode_response(data)
+    encoded = {key: value for key, value in data.items() if key not in ('questions', 'responses', 'qa_pairs')}
+    encoded['schema_version'] = RESPONSE_SCHEMA_VERSION
+    encoded['qa_pairs'] = [
+        {'question': pair['question'], 'response': pair['response']}
+        for pair in decoded['qa_pairs']
+    ]
+    return encoded
+
+def _build_rating_data(rating_id, user_id, topic, ratings, feedback=None):
+    """Build the streamlitRatings document for a rating."""
+    return {
+        'rating_id': rating_id,
+        'user_id': user_id,
+        'topic': topic,
+        'ratings': ratings,  # Dictionary with informative, engaging, repeat scores
+        'informative_rating': ratings.get('informative', 3),
+        'engaging_rating': ratings.get('engaging', 3), 
+        'repeat_rating': ratings.get('repeat', 3),
+        'overall_rating': round((ratings.get('informative', 3) + ratings.get('engaging', 3) + ratings.get('repeat', 3)) / 3, 1),  # Average for backward compatibility
+        'feedback': feedback,
+        'created_at': datetime.now()
+    }
+
+def _stage_topic_stats(batch, db, topic, response_data=None, rating_data=None):
+    """Add the topic counter updates for a response and/or rating to a write batch."""
+    # Imported on first write so the SDK isn't loaded before the first page renders
+    from firebase_admin import firestore
+    
+    shard_ref, shard = _topic_stats_shard(db, topic)
+    shard_update = {
+        'topic': topic,
+        'shard': shard,
+        'updated_at': datetime.now()
+    }
+    if response_data is not None:
+        shard_update['response_count'] = firestore.Increment(1)
+    if rating_data is not None:
+        shard_update['rating_count'] = firestore.Increment(1)
+        shard_update['rating_sum'] = firestore.Increment(rating_data['overall_rating'])
+    batch.set(shard_ref, shard_update, merge=True)
+
 def save_responses(user_id, topic, questions, responses):
-    """Save user questions and responses to Firestore."""
+    """Save user questions and responses."""
     try:
-        db = get_db()
         response_id = str(uuid.uuid4())
+        response_data = _build_response_data(response_id, user_id, topic, questions, responses)
         
-        # Create question-response pairs for better structure
-        qa_pairs = []
-        for i, (question, response) in enumerate(zip(questions, responses)):
-            qa_pairs.append({
-                'question_number': i + 1,
-                'question': question,
-                'response': response
-            })
-        
-        response_data = {
-            'response_id': response_id,
-            'user_id': user_id,
-            'topic': topic,
-            'qa_pairs': qa_pairs,
-            'questions': questions,  # Keep for backward compatibility
-            'responses': responses,  # Keep for backward compatibility
-            'completed_at': datetime.now()
-        }
-        
-        db.collection('streamlitResponses').document(response_id).set(response_data)
+        # The response and the topic counter are written atomically
+        get_storage().save_responses(response_data)
         return response_id
     except Exception as e:
         st.error(f"Error saving responses: {str(e)}")
         return None
 
 def save_rating(user_id, topic, ratings, feedback=None):
-    """Save user ratings and feedback to Firestore."""
+    """Save user ratings and feedback."""
     try:
-        db = get_db()
         rating_id = str(uuid.uuid4())
+        rating_data = _build_rating_data(rating_id, user_id, topic, ratings, feedback)
         
-        rating_data = {
-            'rating_id': rating_id,
-            'user_id': user_id,
-            'topic': topic,
-            'ratings': ratings,  # Dictionary with informative, engaging, repeat scores
-            'informative_rating': ratings.get('informative', 3),
-            'engaging_rating': ratings.get('engaging', 3), 
-            'repeat_rating': ratings.get('repeat', 3),
-            'overall_rating': round((ratings.get('informative', 3) + ratings.get('engaging', 3) + ratings.get('repeat', 3)) / 3, 1),  # Average for backward compatibility
-            'feedback': feedback,
-            'created_at': datetime.now()
-        }
-        
-        db.collection('streamlitRatings').document(rating_id).set(rating_data)
+        # The rating and the topic rating sum are written atomically
+        get_storage().save_rating(rating_data)
         return rating_id
     except Exception as e:
         st.error(f"Error saving rating: {str(e)}")
         return None
 
+def save_session_results(user_id, topic, questions, responses, ratings, feedback=None):
+    """
+    Save a completed session's responses and rating in a single atomic write.
+    
+    The response document, the rating document and the topic counter
+    updates are committed together (one Firestore batch or SQLite
+    transaction), so either all of them are saved or none are.
+    
+    Returns:
+        Tuple of (response_id, rating_id), or (None, None) on failure
+    """
+    try:
+        response_id = str(uuid.uuid4())
+        rating_id = str(uuid.uuid4())
+        response_data = _build_response_data(response_id, user_id, topic, questions, responses)
+        rating_data = _build_rating_data(rating_id, user_id, topic, ratings, feedback)
+        
+        get_storage().save_session_results(response_data, rating_data)
+        return response_id, rating_id
+    except Exception as e:
+        st.error(f"Error saving your session: {str(e)}")
+        return None, None
+
+def save_session_checkpoint(session_id, fields, questions=None, responses=None, reset=False):
+    """
+    Merge a checkpoint of an in-progress session into its session document.
+    
+    Questions and responses are stored as maps keyed by index, so a
+    checkpoint only needs to carry the entries that changed.
+    
+    Args:
+        session_id: Session token the document is keyed by
+        fields: Top-level fields to merge, e.g. stage and current_question
+        questions: Dictionary mapping question index to question text
+        responses: Dictionary mapping question index to response text
+        reset: Clear the stored questions and responses, e.g. on a new topic
+    """
+    try:
+        fields = dict(fields, session_id=session_id, updated_at=datetime.now())
+        if questions:
+            fields['questions'] = {str(i): text for i, text in questions.items()}
+        if responses:
+            fields['responses'] = {str(i): text for i, text in responses.items()}
+        get_storage().save_session_checkpoint(session_id, fields, reset=reset)
+        return True
+    except Exception as e:
+        # A missed checkpoint shouldn't interrupt the session
+        logger.warning("Error checkpointing session %s: %s", session_id, e)
+        return False
+
+def _indexed_list(entries):
+    """Turn a map keyed by index back into a list."""
+    entries = entries or {}
+    items = [""] * (max((int(i) for i in entries), default=-1) + 1)
+    for i, text in entries.items():
+        items[int(i)] = text
+    return items
+
+def load_session_checkpoint(session_id):
+    """
+    Load a checkpointed session.
+    
+    Returns:
+        Session dictionary with questions and responses as lists, or None
+        if there is no such session
+    """
+    try:
+        session = get_storage().load_session_checkpoint(session_id)
+        if session is None:
+            return None
+        session['questions'] = _indexed_list(session.get('questions'))
+        session['responses'] = _indexed_list(session.get('responses'))
+        return session
+    except Exception as e:
+        logger.warning("Error loading session %s: %s", session_id, e)
+        return None
+
+def get_user_responses_page(user_id, page_size=20, start_after=None, fields=None, descending=True):
+    """
+    Get one page of a user's responses, ordered by completed_at.
+    
+    Args:
+        user_id: User whose responses to read
+        page_size: Maximum documents to read
+        start_after: Cursor returned with the previous page
+        fields: Field paths to read (e.g. HISTORY_FIELDS), or None for
+            full decoded documents
+        descending: Newest first
+    
+    Returns:
+        Tuple of (list of response dicts, cursor for the next page or None)
+    """
+    responses, next_cursor = get_storage().get_user_responses_page(
+        user_id, page_size, start_after, fields, descending
+    )
+    if not fields:
+        responses = [decode_response(data) for data in responses]
+    return responses, next_cursor
+
+def iter_user_responses(user_id, page_size=100, fields=None, descending=True):
+    """
+    Yield a user's responses one page at a time, newest first by default.
+    
+    Newest first uses the same composite index as the history list;
+    descending=False needs a second (user_id, completed_at ascending) index.
+    """
+    cursor = None
+    while True:
+        responses, cursor = get_user_responses_page(user_id, page_size, cursor, fields, descending)
+        yield from responses
+        if cursor is None:
+            return
+
 def get_user_responses(user_id):
-    """Get all responses for a specific user."""
+    """Get all responses for a specific user, newest first."""
     try:
-        db = get_db()
-        responses = db.collection('streamlitResponses').where('user_id', '==', user_id).get()
-        return [doc.to_dict() for doc in responses]
+        return list(iter_user_responses(user_id))
     except Exception as e:
         st.error(f"Error retrieving user responses: {str(e)}")
         return []
 
+def get_response_transcript(response_id):
+    """Get one full, decoded response document, or None if it doesn't exist."""
+    try:
+        data = get_storage().get_response(response_id)
+        return decode_response(data) if data is not None else None
+    except Exception as e:
+        st.error(f"Error retrieving your reflection: {str(e)}")
+        return None
+
+def _summarize_topic_shards(shards):
+    """Combine stats shard dictionaries into the public topic stats dict."""
+    response_count = 0
+    rating_count = 0
+    rating_sum = 0
+    for data in shards:
+        response_count += data.get('response_count', 0)
+        rating_count += data.get('rating_count', 0)
+        rating_sum += data.get('rating_sum', 0)
+    
+    return summarize_topic_counts(response_count, rating_count, rating_sum)
+
 def get_topic_stats(topic):
     """Get basic statistics for a topic (number of completions, average rating)."""
     try:
-        db = get_db()
-        
-        # Count responses for this topic
-        responses = db.collection('streamlitResponses').where('topic', '==', topic).get()
-        response_count = len(responses)
-        
-        # Get average rating for this topic (use overall_rating for backward compatibility)
-        ratings = db.collection('ratings').where('topic', '==', topic).get()
-        rating_values = []
-        for doc in ratings:
-            data = doc.to_dict()
-            # Try new overall_rating field first, fall back to old rating field
-            rating = data.get('overall_rating', data.get('rating', 0))
-            if rating > 0:
-                rating_values.append(rating)
-        
-        avg_rating = sum(rating_values) / len(rating_values) if rating_values else 0
-        
-        return {
-            'response_count': response_count,
-            'avg_rating': round(avg_rating, 1),
-            'rating_count': len(rating_values)
-        }
+        return get_storage().get_topic_stats(topic)
     except Exception as e:
         st.error(f"Error getting topic stats: {str(e)}")
-        return {'response_count': 0, 'avg_rating': 0, 'rating_count': 0}
+        return dict(EMPTY_TOPIC_STATS)
+
+@st.cache_data(ttl=STATS_CACHE_TTL, show_spinner=False)
+def _fetch_all_topic_stats():
+    """Read every stats shard in one query and summarize them per topic."""
+    db = get_db()
+    shards_by_topic = {}
+    for doc in db.collection(TOPIC_STATS_COLLECTION).get():
+        data = doc.to_dict()
+        shards_by_topic.setdefault(data.get('topic'), []).append(data)
+    
+    return {topic: _summarize_topic_shards(shards) for topic, shards in shards_by_topic.items()}
+
+def get_all_topic_stats():
+    """
+    Get statistics for every topic in a single round trip.
+    
+    With Firestore, results are cached process-wide for STATS_CACHE_TTL
+    seconds and invalidated whenever a response or rating is saved.
+    
+    Returns:
+        Dictionary mapping topic key to its stats dict
+    """
+    try:
+        stats = get_storage().get_all_topic_stats()
+    except Exception as e:
+        st.error(f"Error getting topic stats: {str(e)}")
+        stats = {}
+    
+    return {topic_key: stats.get(topic_key, dict(EMPTY_TOPIC_STATS)) for topic_key, _ in get_topic_list()}
+
+def backfill_topic_stats():
+    """
+    Rebuild the per-topic stats shards from existing responses and ratings.
+    
+    Shard 0 of each topic is overwritten with the full totals and the other
+    shards are reset, so run this while no new sessions are being saved.
+    
+    Returns:
+        Dictionary mapping topic to its recomputed totals
+    """
+    db = get_db()
+    totals = {}
+    
+    def topic_totals(topic):
+        return totals.setdefault(topic, {'response_count': 0, 'rating_count': 0, 'rating_sum': 0})
+    
+    for doc in db.collection(RESPONSES_COLLECTION).select(['topic']).stream():
+        topic = doc.to_dict().get('topic')
+        if topic:
+            topic_totals(topic)['response_count'] += 1
+    
+    for doc in db.collection(RATINGS_COLLECTION).select(['topic', 'overall_rating', 'rating']).stream():
+        data = doc.to_dict()
+        topic = data.get('topic')
+        # Try new overall_rating field first, fall back to old rating field
+        rating = data.get('overall_rating', data.get('rating', 0))
+        if topic and rating > 0:
+            topic_totals(topic)['rating_count'] += 1
+            topic_totals(topic)['rating_sum'] += rating
+    
+    batch = db.batch()
+    for topic, counts in totals.items():
+        for shard in range(TOPIC_STATS_SHARDS):
+            shard_data = {
+                'topic': topic,
+                'shard': shard,
+                'response_count': 0,
+                'rating_count': 0,
+                'rating_sum': 0,
+                'updated_at': datetime.now()
+            }
+            if shard == 0:
+                shard_data.update(counts)
+            batch.set(db.collection(TOPIC_STATS_COLLECTION).document(f"{topic}_{shard}"), shard_data)
+    batch.commit()
+    _fetch_all_topic_stats.clear()
+    
+    return totals
+
+def _load_migration_checkpoint(checkpoint_path):
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding='utf-8') as f:
+            return json.load(f)
+    return {'last_id': None, 'scanned': 0, 'migrated': 0, 'done': False}
+
+def _save_migration_checkpoint(checkpoint_path, progress):
+    if not checkpoint_path:
+        return
+    # Write then rename, so an interrupted run never leaves a torn checkpoint
+    temp_path = f"{checkpoint_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(progress, f)
+    os.replace(temp_path, checkpoint_path)
+
+def migrate_responses_to_v2(page_size=500, concurrency=4, checkpoint_path=None, dry_run=False, on_progress=None):
+    """
+    Rewrite v1 response documents in the v2 schema.
+    
+    Documents are read a page at a time in document id order. Each page's
+    rewrites are committed in batches with at most `concurrency` batches
+    in flight, then the id of the page's last document is saved to the
+    checkpoint file, so an interrupted run resumes after the last finished
+    page. Documents already in v2 are skipped, so re-running is safe.
+    
+    Args:
+        page_size: Documents read per page
+        concurrency: Maximum batch commits in flight
+        checkpoint_path: JSON file progress is saved to and resumed from
+        dry_run: Count the documents that would be rewritten without writing
+        on_progress: Callable (progress) run after each page
+    
+    Returns:
+        Progress dictionary with last_id, scanned, migrated and done
+    """
+    db = get_db()
+    collection = db.collection(RESPONSES_COLLECTION)
+    progress = _load_migration_checkpoint(None if dry_run else checkpoint_path)
+    if progress['done']:
+        return progress
+    
+    def commit(writes):
+        batch = db.batch()
+        for reference, data in writes:
+            batch.set(reference, data)
+        batch.commit()
+    
+    cursor = collection.document(progress['last_id']).get() if progress['last_id'] else None
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            query = collection.order_by('__name__').limit(page_size)
+            if cursor is not None:
+                query = query.start_after(cursor)
+            page = query.get()
+            if not page:
+                break
+            
+            writes = [
+                (doc.reference, _encode_response_v2(doc.to_dict()))
+                for doc in page
+                if doc.to_dict().get('schema_version', 1) < RESPONSE_SCHEMA_VERSION
+            ]
+            if writes and not dry_run:
+                chunks = [writes[i:i + MIGRATION_BATCH_SIZE] for i in range(0, len(writes), MIGRATION_BATCH_SIZE)]
+                # Raises (leaving the checkpoint at the previous page) if any batch fails
+                list(executor.map(commit, chunks))
+            
+            cursor = page[-1]
+            progress['last_id'] = cursor.id
+            progress['scanned'] += len(page)
+            progress['migrated'] += len(writes)
+            if not dry_run:
+                _save_migration_checkpoint(checkpoint_path, progress)
+            if on_progress:
+                on_progress(progress)
+    
+    progress['done'] = True
+    if not dry_run:
+        _save_migration_checkpoint(checkpoint_path, progress)
+    return progress
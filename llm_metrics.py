@@ -0,0 +1,463 @@
+"""
+LLM call metrics for the Relationship Reflection App.
+
+Every completion records its latency, token usage (including cached and
+reasoning tokens), estimated cost and outcome per call site and topic.
+Metrics are kept in memory for percentiles, optionally appended to a
+JSONL file, and can be served in Prometheus text format. Page render
+times per scope (a full script run or a single fragment) and question
+routing decisions (primary model, or a hedge to a faster model) are kept
+alongside them.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import streamlit as st
+from config import get_setting
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens; override with [metrics.prices.<model>] in secrets
+DEFAULT_PRICES = {
+    "gpt-5": {"input": 1.25, "cached_input": 0.125, "output": 10.0},
+    "gpt-5-mini": {"input": 0.25, "cached_input": 0.025, "output": 2.0},
+    "gpt-5-nano": {"input": 0.05, "cached_input": 0.005, "output": 0.4},
+}
+
+# Latency samples kept per call site and topic for percentiles
+LATENCY_SAMPLES = 1000
+
+PERCENTILES = (50, 95, 99)
+
+_metrics = {}
+_render_times = {}
+_routes = {}
+_admissions = {}
+_lock = threading.Lock()
+_jsonl_lock = threading.Lock()
+
+def _new_entry():
+    return {
+        'calls': 0,
+        'errors': 0,
+        'fallbacks': 0,
+        'cache_hits': 0,
+        'cache_misses': 0,
+        'prompt_tokens': 0,
+        'cached_tokens': 0,
+        'completion_tokens': 0,
+        'reasoning_tokens': 0,
+        'cost_usd': 0.0,
+        'latencies': deque(maxlen=LATENCY_SAMPLES),
+        'first_token_latencies': deque(maxlen=LATENCY_SAMPLES)
+    }
+
+def _usage_counts(usage):
+    """Pull token counts out of an OpenAI usage object."""
+    if usage is None:
+        return {'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0, 'reasoning_tokens': 0}
+    prompt_details = getattr(usage, 'prompt_tokens_details', None)
+    completion_details = getattr(usage, 'completion_tokens_details', None)
+    return {
+        'prompt_tokens': usage.prompt_tokens or 0,
+        'cached_tokens': (getattr(prompt_details, 'cached_tokens', 0) or 0) if prompt_details else 0,
+        'completion_tokens': usage.completion_tokens or 0,
+        'reasoning_tokens': (getattr(completion_details, 'reasoning_tokens', 0) or 0) if completion_details else 0
+    }
+
+def estimate_cost(model, counts):
+    """Estimate the USD cost of a call from its token counts."""
+    prices = dict(DEFAULT_PRICES.get(model, {}))
+    prices.update(get_setting('metrics', 'prices', {}).get(model, {}))
+    if not prices:
+        return 0.0
+    uncached = counts['prompt_tokens'] - counts['cached_tokens']
+    cost = (
+        uncached * prices.get('input', 0)
+        + counts['cached_tokens'] * prices.get('cached_input', prices.get('input', 0))
+        + counts['completion_tokens'] * prices.get('output', 0)
+    )
+    return cost / 1_000_000
+
+def _write_jsonl(record):
+    """Append a record to the configured JSONL file, if any."""
+    path = get_setting('metrics', 'jsonl_path')
+    if not path:
+        return
+    with _jsonl_lock:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+
+def _record_session_usage(call_site, counts):
+    """Add token counts to st.session_state.llm_usage for the current session."""
+    try:
+        session_usage = st.session_state.setdefault('llm_usage', {})
+        site_totals = session_usage.setdefault(call_site, dict.fromkeys(['calls'] + list(counts), 0))
+        site_totals['calls'] += 1
+        for key, value in counts.items():
+            site_totals[key] += value
+    except Exception:
+        # Not running inside a Streamlit session
+        pass
+
+def record_call(call_site, topic, model, latency, usage=None, error=None, first_token_latency=None):
+    """
+    Record one completion call.
+
+    Args:
+        call_site: Name of the calling function, e.g. "generate_question"
+        topic: Topic key the call was for, or None
+        model: Model name
+        latency: Seconds from request to full response (or failure)
+        usage: OpenAI usage object, if the call succeeded
+        error: Exception raised by the call, if it failed
+        first_token_latency: Seconds to the first streamed token, for streams
+    """
+    counts = _usage_counts(usage)
+    cost = estimate_cost(model, counts)
+
+    with _lock:
+        entry = _metrics.setdefault((call_site, topic or ""), _new_entry())
+        entry['calls'] += 1
+        entry['errors'] += 1 if error is not None else 0
+        entry['cost_usd'] += cost
+        for key, value in counts.items():
+            entry[key] += value
+        entry['latencies'].append(latency)
+        if first_token_latency is not None:
+            entry['first_token_latencies'].append(first_token_latency)
+
+    if usage is not None:
+        _record_session_usage(call_site, counts)
+
+    _write_jsonl({
+        'event': 'llm_call',
+        'timestamp': datetime.now().isoformat(),
+        'call_site': call_site,
+        'topic': topic,
+        'model': model,
+        'latency': round(latency, 4),
+        'first_token_latency': round(first_token_latency, 4) if first_token_latency is not None else None,
+        'error': type(error).__name__ if error is not None else None,
+        'cost_usd': round(cost, 6),
+        **counts
+    })
+
+def record_fallback(call_site, topic):
+    """Record that a call site served its fallback text instead of a generated one."""
+    with _lock:
+        _metrics.setdefault((call_site, topic or ""), _new_entry())['fallbacks'] += 1
+
+    _write_jsonl({
+        'event': 'llm_fallback',
+        'timestamp': datetime.now().isoformat(),
+        'call_site': call_site,
+        'topic': topic
+    })
+
+def _new_route_entry():
+    return {
+        'decisions': {},
+        'slo_misses': 0,
+        'served_latencies': deque(maxlen=LATENCY_SAMPLES),
+        'hedge_savings': deque(maxlen=LATENCY_SAMPLES)
+    }
+
+def record_route(call_site, topic, decision, served_latency, slo=None):
+    """
+    Record which route served a hedged request.
+
+    Args:
+        call_site: Name of the calling function
+        topic: Topic key the call was for, or None
+        decision: "primary" (no hedge sent), "primary_after_hedge" or "hedge"
+        served_latency: Seconds until the winning route's first token
+        slo: Latency objective in seconds; slower requests count as misses
+    """
+    with _lock:
+        entry = _routes.setdefault((call_site, topic or ""), _new_route_entry())
+        entry['decisions'][decision] = entry['decisions'].get(decision, 0) + 1
+        entry['served_latencies'].append(served_latency)
+        if slo is not None and served_latency > slo:
+            entry['slo_misses'] += 1
+
+    _write_jsonl({
+        'event': 'llm_route',
+        'timestamp': datetime.now().isoformat(),
+        'call_site': call_site,
+        'topic': topic,
+        'decision': decision,
+        'served_latency': round(served_latency, 4)
+    })
+
+def record_hedge_savings(call_site, topic, seconds):
+    """Record how much sooner a winning hedge answered than the primary it replaced."""
+    with _lock:
+        _routes.setdefault((call_site, topic or ""), _new_route_entry())['hedge_savings'].append(seconds)
+
+def record_render(scope, seconds):
+    """
+    Record how long one script run or fragment run took to render.
+
+    Args:
+        scope: What was rendered, e.g. "app:questions" or "fragment:show_answer_controls"
+        seconds: Render time in seconds
+    """
+    with _lock:
+        _render_times.setdefault(scope, deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+    _write_jsonl({
+        'event': 'render',
+        'timestamp': datetime.now().isoformat(),
+        'scope': scope,
+        'seconds': round(seconds, 4)
+    })
+
+def record_cache(call_site, topic, hit):
+    """Record a response cache lookup for a call site; hits are served without an API call."""
+    with _lock:
+        entry = _metrics.setdefault((call_site, topic or ""), _new_entry())
+        entry['cache_hits' if hit else 'cache_misses'] += 1
+
+def record_admission(priority_class, call_site, wait, admitted):
+    """
+    Record how long a call waited for rate-limit admission.
+
+    Args:
+        priority_class: Admission priority class, e.g. "question"
+        call_site: Name of the calling function, or None
+        wait: Seconds waited
+        admitted: False if the call gave up waiting
+    """
+    with _lock:
+        entry = _admissions.setdefault(priority_class, {
+            'admitted': 0, 'timeouts': 0, 'waits': deque(maxlen=LATENCY_SAMPLES)
+        })
+        entry['admitted' if admitted else 'timeouts'] += 1
+        entry['waits'].append(wait)
+
+    if not admitted:
+        _write_jsonl({
+            'event': 'admission_timeout',
+            'timestamp': datetime.now().isoformat(),
+            'priority_class': priority_class,
+            'call_site': call_site,
+            'wait': round(wait, 4)
+        })
+
+def _percentile(samples, percentile):
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(percentile / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+class Timer:
+    """Tracks elapsed time and time to first token for a call."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+
+    def mark_first_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.start
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+def get_metrics():
+    """
+    Get a snapshot of the metrics per call site and topic.
+
+    Returns:
+        Dictionary mapping (call_site, topic) to counters, fallback rate and
+        latency percentiles in seconds
+    """
+    with _lock:
+        snapshot = {}
+        for key, entry in _metrics.items():
+            stats = {name: value for name, value in entry.items() if not isinstance(value, deque)}
+            # Results users saw: successful calls, cache hits and fallbacks; a
+            # failed call is only counted through the fallback served in its place
+            served = entry['calls'] - entry['errors'] + entry['cache_hits'] + entry['fallbacks']
+            stats['fallback_rate'] = entry['fallbacks'] / served if served else 0.0
+            for percentile in PERCENTILES:
+                stats[f'latency_p{percentile}'] = _percentile(entry['latencies'], percentile)
+                stats[f'first_token_latency_p{percentile}'] = _percentile(entry['first_token_latencies'], percentile)
+            snapshot[key] = stats
+        return snapshot
+
+def get_route_metrics():
+    """
+    Get routing decisions per call site and topic.
+
+    Returns:
+        Dictionary mapping (call_site, topic) to decision counts, SLO
+        misses, and served latency and hedge savings percentiles in seconds
+    """
+    with _lock:
+        snapshot = {}
+        for key, entry in _routes.items():
+            stats = {'decisions': dict(entry['decisions']), 'slo_misses': entry['slo_misses']}
+            for percentile in PERCENTILES:
+                stats[f'served_latency_p{percentile}'] = _percentile(entry['served_latencies'], percentile)
+                stats[f'hedge_savings_p{percentile}'] = _percentile(entry['hedge_savings'], percentile)
+            snapshot[key] = stats
+        return snapshot
+
+def get_render_metrics():
+    """
+    Get render time percentiles per scope.
+
+    Returns:
+        Dictionary mapping scope to its run count and render time
+        percentiles in seconds
+    """
+    with _lock:
+        return {
+            scope: {
+                'renders': len(samples),
+                **{f'render_p{percentile}': _percentile(samples, percentile) for percentile in PERCENTILES}
+            }
+            for scope, samples in _render_times.items()
+        }
+
+def get_admission_metrics():
+    """
+    Get rate-limit admission counts and wait percentiles per priority class.
+
+    Returns:
+        Dictionary mapping priority class to admitted and timed-out counts
+        and wait percentiles in seconds
+    """
+    with _lock:
+        return {
+            priority_class: {
+                'admitted': entry['admitted'],
+                'timeouts': entry['timeouts'],
+                **{f'wait_p{percentile}': _percentile(entry['waits'], percentile) for percentile in PERCENTILES}
+            }
+            for priority_class, entry in _admissions.items()
+        }
+
+def get_render_samples():
+    """Get the raw render time samples per scope, e.g. to merge across processes."""
+    with _lock:
+        return {scope: list(samples) for scope, samples in _render_times.items()}
+
+def render_prometheus():
+    """Render the current metrics in Prometheus text exposition format."""
+    counters = ['calls', 'errors', 'fallbacks', 'cache_hits', 'cache_misses', 'prompt_tokens', 'cached_tokens',
+                'completion_tokens', 'reasoning_tokens', 'cost_usd']
+    snapshot = get_metrics()
+    lines = []
+    for name in counters:
+        lines.append(f"# TYPE llm_{name}_total counter")
+        for (call_site, topic), stats in snapshot.items():
+            lines.append(f'llm_{name}_total{{call_site="{call_site}",topic="{topic}"}} {stats[name]}')
+    for name in ['latency', 'first_token_latency']:
+        lines.append(f"# TYPE llm_{name}_seconds summary")
+        for (call_site, topic), stats in snapshot.items():
+            for percentile in PERCENTILES:
+                quantile = percentile / 100
+                lines.append(
+                    f'llm_{name}_seconds{{call_site="{call_site}",topic="{topic}",quantile="{quantile}"}} '
+                    f'{stats[f"{name}_p{percentile}"]:.4f}'
+                )
+    routes = get_route_metrics()
+    lines.append("# TYPE llm_route_decisions_total counter")
+    for (call_site, topic), stats in routes.items():
+        for decision, count in stats['decisions'].items():
+            lines.append(f'llm_route_decisions_total{{call_site="{call_site}",topic="{topic}",decision="{decision}"}} {count}')
+    lines.append("# TYPE llm_route_slo_misses_total counter")
+    for (call_site, topic), stats in routes.items():
+        lines.append(f'llm_route_slo_misses_total{{call_site="{call_site}",topic="{topic}"}} {stats["slo_misses"]}')
+    for name in ['served_latency', 'hedge_savings']:
+        lines.append(f"# TYPE llm_route_{name}_seconds summary")
+        for (call_site, topic), stats in routes.items():
+            for percentile in PERCENTILES:
+                lines.append(
+                    f'llm_route_{name}_seconds{{call_site="{call_site}",topic="{topic}",quantile="{percentile / 100}"}} '
+                    f'{stats[f"{name}_p{percentile}"]:.4f}'
+                )
+    lines.append("# TYPE app_render_seconds summary")
+    for scope, stats in get_render_metrics().items():
+        for percentile in PERCENTILES:
+            lines.append(
+                f'app_render_seconds{{scope="{scope}",quantile="{percentile / 100}"}} '
+                f'{stats[f"render_p{percentile}"]:.4f}'
+            )
+    admissions = get_admission_metrics()
+    lines.append("# TYPE llm_admission_total counter")
+    for priority_class, stats in admissions.items():
+        for outcome in ['admitted', 'timeouts']:
+            lines.append(f'llm_admission_total{{priority_class="{priority_class}",outcome="{outcome}"}} {stats[outcome]}')
+    lines.append("# TYPE llm_admission_wait_seconds summary")
+    for priority_class, stats in admissions.items():
+        for percentile in PERCENTILES:
+            lines.append(
+                f'llm_admission_wait_seconds{{priority_class="{priority_class}",quantile="{percentile / 100}"}} '
+                f'{stats[f"wait_p{percentile}"]:.4f}'
+            )
+    from rate_limiter import get_admission_controller
+    controller = get_admission_controller()
+    if controller is not None:
+        lines.append("# TYPE llm_admission_queue_depth gauge")
+        for priority_class, depth in controller.queue_depth().items():
+            lines.append(f'llm_admission_queue_depth{{priority_class="{priority_class}"}} {depth}')
+    from circuit_breaker import OPEN, get_circuit_breaker
+    circuit = get_circuit_breaker().stats()
+    lines.append("# TYPE llm_circuit_open gauge")
+    lines.append(f"llm_circuit_open {int(circuit['state'] == OPEN)}")
+    lines.append("# TYPE llm_circuit_rejected_total counter")
+    lines.append(f"llm_circuit_rejected_total {circuit['rejected']}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves render_prometheus() on /metrics."""
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@st.cache_resource
+def start_metrics_server():
+    """
+    Start the Prometheus /metrics endpoint once per process, if configured.
+
+    Binds to [metrics] host (127.0.0.1 by default; 0.0.0.0 lets a
+    Prometheus server on another host scrape it).
+
+    Returns:
+        The running server, or None when [metrics] port is not set or
+        can't be bound
+    """
+    port = get_setting('metrics', 'port')
+    if not port:
+        return None
+    host = get_setting('metrics', 'host', "127.0.0.1")
+    try:
+        server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    except OSError:
+        # e.g. the port is taken; the app runs on without the endpoint
+        logger.error("Can't serve metrics on %s:%s", host, port, exc_info=True)
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,236 @@
+"""
+Offline load test for the Relationship Reflection App.
+
+Drives the full app flow (profile -> topic -> 5 questions -> summary ->
+rating) for N simulated users with Streamlit's AppTest, against the
+in-process OpenAI and Firestore stand-ins from fake_backends (or a
+temporary SQLite database with --storage sqlite), with one session at a
+time per worker process. Reports throughput, per-stage
+latency percentiles and backend call counts, plus the app's own render
+times per scope: a full script run per stage ("app:questions") versus a
+single fragment ("fragment:show_answer_controls"). AppTest always reruns
+the whole script, so the fragment times show what an interaction inside
+that fragment costs in a browser, where only the fragment reruns.
+
+Usage:
+    python load_test.py --users 100 --concurrency 8 --llm-latency 1.5
+    python load_test.py --users 100 --storage sqlite
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Must be set before the app's modules are imported
+os.environ.setdefault("DDMVT_FAKE_BACKENDS", "1")
+
+from streamlit.testing.v1 import AppTest
+import fake_backends
+import llm_metrics
+from storage import DRIVERS, get_storage
+from questions import get_topic_list
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+TOTAL_QUESTIONS = 5
+STAGES = (
+    ["first_paint", "profile", "topic_selection"]
+    + [f"answer_{i}" for i in range(1, TOTAL_QUESTIONS + 1)]
+    + ["rating"]
+)
+
+def _button(at, label=None, key=None):
+    """Find a button by key or label."""
+    if key is not None:
+        return at.button(key=key)
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LookupError(f"No button labelled {label!r}")
+
+def _timed(timings, stage, action):
+    """Run an AppTest action and record how long the rerun took."""
+    start = time.perf_counter()
+    at = action()
+    timings[stage] = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"{stage}: {at.exception[0].value}")
+    return at
+
+def simulate_user(user_index, topic_key, timeout):
+    """
+    Run one user's session through the app.
+
+    Returns:
+        Dictionary mapping stage name to seconds
+    """
+    timings = {}
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    _timed(timings, "first_paint", at.run)
+
+    at.text_input[0].input(f"User {user_index}")
+    _timed(timings, "profile", lambda: _button(at, label="Continue").click().run())
+
+    # Selecting a topic renders (and generates) the first question
+    _timed(timings, "topic_selection", lambda: _button(at, key=f"select_{topic_key}").click().run())
+
+    for question_index in range(TOTAL_QUESTIONS):
+        at.text_area(key=f"response_{question_index}").input(
+            f"Answer {question_index + 1} from user {user_index}. " * random.randint(1, 20)
+        ).run()
+        label = "Next →" if question_index < TOTAL_QUESTIONS - 1 else "Complete Exercise"
+        # Answering generates the next question, or the insights and summary
+        _timed(timings, f"answer_{question_index + 1}", lambda: _button(at, label=label).click().run())
+
+    _timed(timings, "rating", lambda: _button(at, label="Submit Rating").click().run())
+    return timings
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+def _run_worker(user_indexes, timeout, fake_settings):
+    """
+    Run a share of the simulated users in one worker process.
+
+    AppTest keeps a process-wide runtime, so sessions can't overlap within
+    a process; concurrency comes from running several worker processes.
+
+    Returns:
+        Tuple of (list of timing dicts, list of error strings, backend call
+        counts, render time samples per scope, question routing decisions)
+    """
+    fake_backends.configure(**fake_settings)
+    fake_backends.reset_call_counts()
+    topics = [topic_key for topic_key, _ in get_topic_list()]
+    results = []
+    errors = []
+    for user_index in user_indexes:
+        try:
+            results.append(simulate_user(user_index, topics[user_index % len(topics)], timeout))
+        except Exception:
+            errors.append(traceback.format_exc(limit=3))
+    # Let the write-behind queue commit the last sessions before counting
+    get_storage().wait_until_idle(timeout)
+    decisions = Counter()
+    for stats in llm_metrics.get_route_metrics().values():
+        decisions.update(stats['decisions'])
+    return results, errors, fake_backends.get_call_counts(), llm_metrics.get_render_samples(), dict(decisions)
+
+def run_load_test(users, concurrency, timeout, fake_settings):
+    """
+    Simulate users across worker processes and collect per-stage timings.
+
+    Returns:
+        Tuple of (list of timing dicts, list of error strings, backend call
+        counts, render time samples per scope, question routing decisions,
+        wall seconds)
+    """
+    workers = max(1, min(concurrency, users))
+    results = []
+    errors = []
+    call_counts = Counter()
+    render_samples = {}
+    route_decisions = Counter()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_run_worker, list(range(worker, users, workers)), timeout, fake_settings)
+            for worker in range(workers)
+        ]
+        for future in as_completed(futures):
+            worker_results, worker_errors, worker_counts, worker_renders, worker_routes = future.result()
+            results.extend(worker_results)
+            errors.extend(worker_errors)
+            call_counts.update(worker_counts)
+            for scope, samples in worker_renders.items():
+                render_samples.setdefault(scope, []).extend(samples)
+            route_decisions.update(worker_routes)
+    return results, errors, dict(call_counts), render_samples, dict(route_decisions), time.perf_counter() - start
+
+def print_report(results, errors, call_counts, render_samples, route_decisions, wall_time):
+    """Print throughput, stage latencies, render times, question routing and backend call counts."""
+    print(f"Completed sessions: {len(results)}  Failed: {len(errors)}  Wall time: {wall_time:.1f}s")
+    if wall_time > 0:
+        print(f"Throughput: {len(results) / wall_time:.2f} sessions/s")
+
+    print()
+    print(f"{'stage':<16}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage in STAGES + ["session_total"]:
+        if stage == "session_total":
+            samples = [sum(timings.values()) for timings in results]
+        else:
+            samples = [timings[stage] for timings in results if stage in timings]
+        print(f"{stage:<16}" + "".join(f"{percentile(samples, pct):>9.3f}s" for pct in (50, 95, 99)))
+
+    print()
+    print(f"{'render scope':<36}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for scope, samples in sorted(render_samples.items()):
+        print(f"{scope:<36}" + "".join(f"{percentile(samples, pct):>9.3f}s" for pct in (50, 95, 99)))
+
+    if route_decisions:
+        print()
+        print("Question routing: " + ", ".join(f"{decision} {count}" for decision, count in sorted(route_decisions.items())))
+
+    print()
+    print("Backend calls:")
+    for name, count in sorted(call_counts.items()):
+        per_session = count / len(results) if results else 0
+        print(f"  {name:<40}{count:>8}  ({per_session:.1f}/session)")
+
+    if errors:
+        print()
+        print("First error:")
+        print(errors[0])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="Number of simulated users")
+    parser.add_argument("--concurrency", type=int, default=4, help="Worker processes, i.e. users running at once")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-rerun timeout in seconds")
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="Median LLM latency in seconds")
+    parser.add_argument("--llm-first-token", type=float, default=0.4, help="Median time to first streamed token")
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="Log-normal sigma of LLM latency")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Fraction of LLM calls that fail with 5xx")
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0.0, help="Fraction of LLM calls that fail with 429")
+    parser.add_argument("--model-latency-scale", action="append", default=[], metavar="MODEL=FACTOR",
+                        help="Slow down one model's fake latency, e.g. gpt-5=3 to exercise hedging")
+    parser.add_argument("--db-latency", type=float, default=0.03, help="Median Firestore latency in seconds")
+    parser.add_argument("--db-error-rate", type=float, default=0.0, help="Fraction of Firestore calls that fail")
+    parser.add_argument("--storage", choices=DRIVERS, default="firestore",
+                        help="Storage driver: the Firestore stand-in or a temporary SQLite file")
+    args = parser.parse_args()
+    
+    # Inherited by the worker processes
+    os.environ["DDMVT_STORAGE_DRIVER"] = args.storage
+    if args.storage == "sqlite":
+        os.environ["DDMVT_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="load_test_"), "load_test.sqlite")
+
+    fake_settings = dict(
+        llm_latency_median=args.llm_latency,
+        llm_first_token_median=args.llm_first_token,
+        llm_latency_sigma=args.llm_sigma,
+        llm_error_rate=args.llm_error_rate,
+        llm_rate_limit_rate=args.llm_rate_limit_rate,
+        llm_model_latency_scale={
+            model: float(factor) for model, factor in (item.split("=", 1) for item in args.model_latency_scale)
+        },
+        db_latency_median=args.db_latency,
+        db_error_rate=args.db_error_rate
+    )
+
+    results, errors, call_counts, render_samples, route_decisions, wall_time = run_load_test(
+        args.users, args.concurrency, args.timeout, fake_settings
+    )
+    print_report(results, errors, call_counts, render_samples, route_decisions, wall_time)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Migrate streamlitResponses documents to the compact v2 schema.
+
+v1 documents store each question and answer three times (qa_pairs plus
+the questions and responses lists); v2 documents store them once. The
+app reads both versions, so this can run while the app is live. Progress
+is checkpointed after every page; re-run the same command to resume.
+
+Usage:
+    python migrate_responses_v2.py --page-size 500 --concurrency 4
+    python migrate_responses_v2.py --dry-run
+"""
+
+import argparse
+from firebase_utils import migrate_responses_to_v2
+
+def main():
+    """Run the migration, printing progress after each page."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=500, help="Documents read per page")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum batch commits in flight")
+    parser.add_argument("--checkpoint", default="migrate_responses_v2.checkpoint.json",
+                        help="File progress is saved to and resumed from")
+    parser.add_argument("--dry-run", action="store_true", help="Count documents to migrate without writing")
+    args = parser.parse_args()
+    
+    def report(progress):
+        print(f"Scanned {progress['scanned']}, {'would migrate' if args.dry_run else 'migrated'} "
+              f"{progress['migrated']} (last id {progress['last_id']})")
+    
+    progress = migrate_responses_to_v2(
+        page_size=args.page_size,
+        concurrency=args.concurrency,
+        checkpoint_path=args.checkpoint,
+        dry_run=args.dry_run,
+        on_progress=report
+    )
+    
+    if progress['scanned'] == 0:
+        print("Nothing to migrate.")
+    else:
+        print(f"Done: {progress['migrated']} of {progress['scanned']} documents "
+              f"{'need migrating' if args.dry_run else 'migrated'}.")
+
+if __name__ == "__main__":
+    main()
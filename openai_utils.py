@@ -2,12 +2,79 @@
 OpenAI utilities for generating dynamic conversation questions.
 """
 
-import openai
+import json
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 import streamlit as st
-from questions import get_topic_prompt
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from circuit_breaker import CircuitOpen, get_circuit_breaker
+from config import get_setting, use_fake_backends
+from llm_metrics import Timer, record_cache, record_call, record_fallback, record_hedge_savings, record_route
+from rate_limiter import AdmissionTimeout, get_admission_controller
+from response_cache import ResponseCacheMiss, get_response_cache, request_key
+from context_budget import count_message_tokens, count_tokens, fit_responses
+from prompt_builder import (
+    build_bank_question_messages, build_digest_messages, build_insight_messages, build_question_messages,
+    build_reflection_messages, build_summary_messages
+)
+from question_bank import bank_question, save_question_bank
+from questions import get_topic_list
+from question_cache import (
+    anonymize_profile, first_question_key, get_first_question_cache,
+    personalize_question, personalize_stream
+)
+
+QUESTION_FALLBACK = "Tell me more about your thoughts on this topic. What comes to mind?"
+INSIGHT_FALLBACK = "• Your responses show thoughtful self-reflection about your relationship\n• You demonstrate awareness of both challenges and strengths in your dynamic\n• There are opportunities for deeper connection and understanding"
+SUMMARY_FALLBACK = "You've shared thoughtful reflections on this topic. Your responses show depth and self-awareness in your relationship journey."
+
+def _retryable_errors():
+    """Errors worth retrying: rate limits, server errors and network trouble."""
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.APIConnectionError,
+    )
+
+def _stream_errors():
+    """Errors mid-stream that count against the service: the retryable ones plus dropped connections and read timeouts."""
+    import httpx
+    return _retryable_errors() + (httpx.TransportError,)
+
+@st.cache_resource
+def _create_openai_client(api_key):
+    """Create the process-wide OpenAI client with a pooled keep-alive HTTP client."""
+    # The SDK is imported here, not at module level, to keep it off the first page render
+    import httpx
+    import openai
+    
+    pool_size = get_setting('openai', 'pool_size', 20)
+    http_client = openai.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=get_setting('openai', 'keepalive_expiry', 60)
+        )
+    )
+    return openai.OpenAI(
+        api_key=api_key,
+        http_client=http_client,
+        timeout=_call_timeout('reflection'),
+        # Retries are handled by _create_completion so the policy is configurable
+        max_retries=0
+    )
 
 def initialize_openai():
-    """Initialize OpenAI client with API key from Streamlit secrets."""
+    """Get the shared OpenAI client, using the API key from Streamlit secrets."""
+    if use_fake_backends():
+        from fake_backends import get_fake_openai
+        return get_fake_openai()
+    
     try:
         # Try to get API key from Streamlit secrets first
         api_key = st.secrets.get("openai", {}).get("api_key")
@@ -15,16 +82,229 @@ def initialize_openai():
             st.error("OpenAI API key not found in Streamlit secrets. Please add it to .streamlit/secrets.toml")
             st.stop()
         
-        client = openai.OpenAI(api_key=api_key)
-        return client
+        return _create_openai_client(api_key)
     except Exception as e:
         st.error(f"Error initializing OpenAI: {str(e)}")
         st.stop()
 
+def _call_timeout(call_type):
+    """Connect/read timeout for a call type ('question' or 'reflection')."""
+    import httpx
+    return httpx.Timeout(
+        get_setting('openai', f'{call_type}_read_timeout', 20 if call_type == 'question' else 60),
+        connect=get_setting('openai', 'connect_timeout', 5)
+    )
+
+def _retry_delay(attempt, error):
+    """Seconds to wait before retry number attempt (0-based), honouring Retry-After."""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), get_setting('openai', 'retry_max_delay', 8))
+        except ValueError:
+            pass
+    
+    # Exponential backoff with full jitter
+    base = get_setting('openai', 'retry_base_delay', 0.5)
+    cap = get_setting('openai', 'retry_max_delay', 8)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def _estimated_tokens(messages, max_completion_tokens):
+    """Upper bound on a request's tokens for rate limiting: its prompt plus the completion limit."""
+    return count_message_tokens(messages) + (max_completion_tokens or 0)
+
+def _settle_tokens(messages, max_completion_tokens, usage):
+    """Replace a request's estimated tokens with its actual usage in the rate limiter."""
+    controller = get_admission_controller()
+    if controller is not None and usage is not None:
+        controller.settle(_estimated_tokens(messages, max_completion_tokens), usage.total_tokens)
+
+def _refund_tokens(messages, max_completion_tokens, used_tokens=0):
+    """Give a failed or cancelled call's unused estimated tokens back to the rate limiter."""
+    controller = get_admission_controller()
+    if controller is not None:
+        controller.settle(_estimated_tokens(messages, max_completion_tokens), used_tokens)
+
+def _create_with_retries(call_type, call_site=None, **kwargs):
+    """
+    Call the shared client, retrying rate limits, server and network errors.
+    
+    Every attempt goes through the circuit breaker, so once the error rate
+    is too high calls raise CircuitOpen at once instead of timing out, and
+    then through the process-wide rate limiter, where it queues by
+    priority (the call type) until there is capacity.
+    """
+    client = initialize_openai()
+    breaker = get_circuit_breaker()
+    controller = get_admission_controller()
+    estimate = _estimated_tokens(kwargs['messages'], kwargs.get('max_completion_tokens'))
+    max_retries = get_setting('openai', 'max_retries', 2)
+    retryable_errors = _retryable_errors()
+    attempt = 0
+    while True:
+        breaker.before_call()
+        if controller is not None:
+            try:
+                controller.acquire(call_type, estimate, call_site)
+            except AdmissionTimeout:
+                breaker.cancel_call()
+                raise
+        try:
+            response = client.chat.completions.create(timeout=_call_timeout(call_type), **kwargs)
+        except retryable_errors as e:
+            breaker.record_failure()
+            # A failed attempt used no tokens; each retry is admitted afresh
+            _refund_tokens(kwargs['messages'], kwargs.get('max_completion_tokens'))
+            if attempt >= max_retries:
+                raise
+            time.sleep(_retry_delay(attempt, e))
+            attempt += 1
+            continue
+        except Exception:
+            # Other API errors (bad requests and the like) mean the service is up
+            breaker.record_success()
+            _refund_tokens(kwargs['messages'], kwargs.get('max_completion_tokens'))
+            raise
+        if kwargs.get('stream'):
+            # Reported to the breaker by _stream_text once the stream ends, since
+            # a stream can still time out or drop after its headers arrive
+            return response
+        breaker.record_success()
+        _settle_tokens(kwargs['messages'], kwargs.get('max_completion_tokens'), response.usage)
+        return response
+
+def _cache_lookup(call_site, topic_key, cache_salt, model, messages, **params):
+    """
+    Look a request up in the response cache.
+    
+    Returns:
+        Tuple of (cache, key, cached text or None); cache is None when disabled
+    
+    Raises:
+        ResponseCacheMiss: On a miss in replay mode
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return None, None, None
+    if cache_salt is not None:
+        params['cache_salt'] = cache_salt
+    key = request_key(model, messages, params)
+    cached = cache.get(key)
+    record_cache(call_site, topic_key, hit=cached is not None)
+    if cached is None and cache.mode == "replay":
+        raise ResponseCacheMiss(f"No recorded response for {call_site} request {key[:12]}")
+    return cache, key, cached
+
+def _cached_completion(text):
+    """A completion-shaped object for a cached response text."""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+
+def _create_completion(call_type, call_site, topic_key=None, cache_salt=None, **kwargs):
+    """
+    Create a chat completion with the shared client, timeouts and retry policy.
+    
+    Identical requests are answered from the response cache. The call's
+    latency, token usage and outcome are recorded in llm_metrics.
+    
+    Args:
+        call_type: 'question' or 'reflection', selects the timeouts
+        call_site: Name of the calling function, for metrics
+        topic_key: Topic the call is for, for metrics
+        cache_salt: Extra response cache key component, so deliberately
+            repeated requests (e.g. question variants) get distinct responses
+        **kwargs: Arguments for client.chat.completions.create
+    
+    Returns:
+        The completion
+    """
+    cache, key, cached = _cache_lookup(call_site, topic_key, cache_salt, **kwargs)
+    if cached is not None:
+        return _cached_completion(cached)
+    
+    timer = Timer()
+    try:
+        response = _create_with_retries(call_type, call_site, **kwargs)
+    except Exception as e:
+        record_call(call_site, topic_key, kwargs.get('model'), timer.elapsed(), error=e)
+        raise
+    record_call(call_site, topic_key, kwargs.get('model'), timer.elapsed(), usage=response.usage)
+    if cache is not None:
+        cache.set(key, response.choices[0].message.content)
+    return response
+
+def _fold_digest(previous_digest, first_number, responses):
+    """Fold responses into the rolling digest of earlier ones in one call; None if it fails."""
+    try:
+        completion = _create_completion(
+            "question",
+            "digest",
+            model="gpt-5",
+            messages=build_digest_messages(previous_digest, first_number, responses),
+            max_completion_tokens=400,
+            reasoning_effort="minimal"
+        )
+        digest = completion.choices[0].message.content.strip()
+        if digest:
+            return digest
+    except Exception:
+        pass
+    
+    # rolling_digest falls back to an extractive digest
+    record_fallback("digest", None)
+    return None
+
+def _question_messages(topic_key, question_number, previous_responses=None, user_profile=None):
+    """Build question messages, compacting older responses to fit the token budget."""
+    base_tokens = count_message_tokens(build_question_messages(topic_key, question_number, None, user_profile))
+    digest, recent, start_number = fit_responses(previous_responses or [], base_tokens, _fold_digest)
+    return build_question_messages(topic_key, question_number, recent, user_profile, digest, start_number)
+
+def _session_messages(build_messages, topic_key, responses, user_profile=None):
+    """Build end-of-session messages, compacting older responses to fit the token budget."""
+    base_tokens = count_message_tokens(build_messages(topic_key, [], user_profile))
+    digest, recent, start_number = fit_responses(
+        responses, base_tokens, _fold_digest,
+        budget=get_setting('openai', 'reflection_token_budget', 12000)
+    )
+    return build_messages(topic_key, recent, user_profile, digest, start_number)
+
+def _opening_variant(cache, cache_key):
+    """
+    Response cache salt for the next opening question variant of a bucket.
+    
+    Every variant is the same request, so without a salt the response cache
+    would fill the bucket's pool with copies of one question. The salt comes
+    from a per-bucket attempt counter rather than the pool size, which stays
+    put when a duplicate is rejected and would replay that duplicate forever.
+    """
+    return f"opening-variant-{cache.fill_attempt(cache_key)}"
+
+def _fallback_question(call_site, topic_key, question_number, error):
+    """
+    Question to show when one can't be generated: a banked question for
+    the topic and question number, or the generic fallback.
+    """
+    # Skipped calls (open circuit, no rate-limit capacity) aren't errors worth showing
+    if error is not None and not isinstance(error, (CircuitOpen, AdmissionTimeout)):
+        st.error(f"Error generating question: {str(error)}")
+    record_fallback(call_site, topic_key)
+    return bank_question(topic_key, question_number) or QUESTION_FALLBACK
+
+def clean_question(question, question_number):
+    """Strip whitespace and any "Question X:" prefix from a generated question."""
+    question = question.strip()
+    if question.startswith(f"Question {question_number}:"):
+        question = question[len(f"Question {question_number}:"):].strip()
+    return question
+
 def generate_question(topic_key, question_number, previous_responses=None, user_profile=None):
     """
     Generate a dynamic question using OpenAI based on the topic and previous responses.
     
+    Opening questions are served from the shared first-question cache when
+    its pool for the user's profile bucket is full.
+    
     Args:
         topic_key: The key of the selected topic
         question_number: Current question number (1-5)
@@ -34,82 +314,37 @@ def generate_question(topic_key, question_number, previous_responses=None, user_
     Returns:
         Generated question as a string
     """
+    opening = question_number == 1 and not previous_responses
+    if opening:
+        cache = get_first_question_cache()
+        cache_key = first_question_key(topic_key, user_profile)
+        cached = cache.get(cache_key)
+        if cached:
+            return personalize_question(cached, user_profile)
+    
     try:
-        client = initialize_openai()
-        
-        # Get the base prompt for this topic
-        base_prompt = get_topic_prompt(topic_key)
-        
-        # Build the conversation context
-        messages = [
-            {
-                "role": "system",
-                "content": base_prompt
-            }
-        ]
-        
-        # Add user profile context if available
-        if user_profile:
-            profile_context = f"""
-            User Profile:
-            - Name: {user_profile.get('name', 'User')}
-            - Age: {user_profile.get('age', 'Unknown')}
-            - Relationship Status: {user_profile.get('relationship_status', 'Unknown')}
-            
-            Please personalize the questions based on this information when appropriate. Address the user by name when appropriate, and thank them for sharing when appropriate.
-            """
-            messages.append({
-                "role": "system",
-                "content": profile_context
-            })
-        
-        # Add previous responses for context
-        if previous_responses:
-            for i, response in enumerate(previous_responses):
-                messages.extend([
-                    {
-                        "role": "assistant",
-                        "content": f"Question {i+1}: [Previous question was asked here]"
-                    },
-                    {
-                        "role": "user",
-                        "content": response
-                    }
-                ])
-        
-        # Request the next question
-        if question_number == 1:
-            request_message = "Please ask the first question to start this reflection exercise."
-        else:
-            request_message = f"Based on the user's previous responses, please ask question {question_number} that builds naturally on what they've shared so far."
-        
-        messages.append({
-            "role": "user",
-            "content": request_message
-        })
-        
-        # Generate the question
-        response = client.chat.completions.create(
-            model="gpt-5",
-            messages=messages,
-            max_completion_tokens=300,
-            reasoning_effort="minimal"
-        )
-
-        print(response)
+        # Opening questions are generated for the profile bucket so they can be shared
+        prompt_profile = anonymize_profile(user_profile) if opening else user_profile
+        messages = _question_messages(topic_key, question_number, previous_responses, prompt_profile)
         
-        question = response.choices[0].message.content.strip()
+        # Generate the question, hedging with a faster model if the primary is slow
+        generated = "".join(_hedged_stream(
+            "generate_question", topic_key, messages, 300,
+            cache_salt=_opening_variant(cache, cache_key) if opening else None
+        ))
         
         # Clean up the question (remove any "Question X:" prefixes)
-        if question.startswith(f"Question {question_number}:"):
-            question = question[len(f"Question {question_number}:"):].strip()
+        question = clean_question(generated, question_number)
+        
+        if opening:
+            cache.add(cache_key, question)
+            question = personalize_question(question, user_profile)
         
         return question
         
     except Exception as e:
-        st.error(f"Error generating question: {str(e)}")
-        # Fallback to a generic question
-        return f"Tell me more about your thoughts on this topic. What comes to mind?"
+        # Fall back to a banked question (served straight away while the circuit is open)
+        return _fallback_question("generate_question", topic_key, question_number, e)
 
 def generate_insight(topic_key, responses, user_profile=None):
     """
@@ -124,47 +359,13 @@ def generate_insight(topic_key, responses, user_profile=None):
         Generated insight as a string
     """
     try:
-        client = initialize_openai()
-        
-        # Get the base prompt for context
-        base_prompt = get_topic_prompt(topic_key)
-        
-        # Build the insight request
-        messages = [
-            {
-                "role": "system",
-                "content": f"""
-                {base_prompt}
-                
-                Based on the user's responses, generate 2-3 key insights that:
-                1. Reveal patterns or themes in their responses
-                2. Offer gentle, supportive observations about their relationship dynamics
-                3. Highlight strengths and areas for growth
-                4. Are specific to what they shared, not generic advice
-                5. Are warm, empathetic, and non-judgmental
-                6. Help them see their situation with fresh perspective
-                
-                Format as 2-3 bullet points starting with "•"
-                """
-            }
-        ]
-        
-        # Add user profile if available
-        if user_profile:
-            messages.append({
-                "role": "system",
-                "content": f"User is {user_profile.get('age', 'unknown')} years old and {user_profile.get('relationship_status', 'unknown')} relationship status."
-            })
-        
-        # Add all responses
-        responses_text = "\n\n".join([f"Response {i+1}: {response}" for i, response in enumerate(responses)])
-        messages.append({
-            "role": "user",
-            "content": f"Here are my responses to the reflection questions:\n\n{responses_text}\n\nPlease provide key insights about my relationship patterns and dynamics."
-        })
+        messages = _session_messages(build_insight_messages, topic_key, responses, user_profile)
         
         # Generate the insights
-        response = client.chat.completions.create(
+        response = _create_completion(
+            "reflection",
+            "generate_insight",
+            topic_key,
             model="gpt-5",
             messages=messages,
             max_completion_tokens=1000,
@@ -176,7 +377,8 @@ def generate_insight(topic_key, responses, user_profile=None):
     except Exception as e:
         st.error(f"Error generating insights: {str(e)}")
         # Fallback to a simple insight
-        return "• Your responses show thoughtful self-reflection about your relationship\n• You demonstrate awareness of both challenges and strengths in your dynamic\n• There are opportunities for deeper connection and understanding"
+        record_fallback("generate_insight", topic_key)
+        return INSIGHT_FALLBACK
 
 def generate_summary(topic_key, responses, user_profile=None):
     """
@@ -191,44 +393,13 @@ def generate_summary(topic_key, responses, user_profile=None):
         Generated summary as a string
     """
     try:
-        client = initialize_openai()
-        
-        # Get the base prompt for context
-        base_prompt = get_topic_prompt(topic_key)
-        
-        # Build the summary request
-        messages = [
-            {
-                "role": "system",
-                "content": f"""
-                {base_prompt}
-                
-                Based on the user's responses, create a thoughtful summary that:
-                1. Identifies key themes and patterns
-                2. Offers gentle insights without being prescriptive
-                3. Highlights what might really be at stake
-                4. Is supportive and non-judgmental
-                5. Is 2-3 paragraphs long
-                """
-            }
-        ]
-        
-        # Add user profile if available
-        if user_profile:
-            messages.append({
-                "role": "system",
-                "content": f"User is {user_profile.get('age', 'unknown')} years old and {user_profile.get('relationship_status', 'unknown')} relationship status."
-            })
-        
-        # Add all responses
-        responses_text = "\n\n".join([f"Response {i+1}: {response}" for i, response in enumerate(responses)])
-        messages.append({
-            "role": "user",
-            "content": f"Here are my responses to the reflection questions:\n\n{responses_text}\n\nPlease provide a thoughtful summary of my reflections."
-        })
+        messages = _session_messages(build_summary_messages, topic_key, responses, user_profile)
         
         # Generate the summary
-        response = client.chat.completions.create(
+        response = _create_completion(
+            "reflection",
+            "generate_summary",
+            topic_key,
             model="gpt-5",
             messages=messages,
             max_completion_tokens=1000,
@@ -240,4 +411,495 @@ def generate_summary(topic_key, responses, user_profile=None):
     except Exception as e:
         st.error(f"Error generating summary: {str(e)}")
         # Fallback to a simple summary
-        return f"You've shared thoughtful reflections on this topic. Your responses show depth and self-awareness in your relationship journey."
+        record_fallback("generate_summary", topic_key)
+        return SUMMARY_FALLBACK
+
+def _stream_text(call_site, topic_key, call_type, messages, max_completion_tokens, reasoning_effort,
+                 cache_salt=None, model="gpt-5"):
+    """
+    Yield text deltas from a streamed chat completion, recording its metrics.
+    
+    A cached response is yielded as a single delta. A stream that completes
+    is cached under the same key as the equivalent non-streamed request.
+    Closing the generator early closes the HTTP stream.
+    """
+    cache, key, cached = _cache_lookup(
+        call_site, topic_key, cache_salt, model, messages,
+        max_completion_tokens=max_completion_tokens, reasoning_effort=reasoning_effort
+    )
+    if cached is not None:
+        yield cached
+        return
+    
+    breaker = get_circuit_breaker()
+    timer = Timer()
+    usage = None
+    pieces = []
+    stream = None
+    try:
+        stream = _create_with_retries(
+            call_type,
+            call_site,
+            model=model,
+            messages=messages,
+            max_completion_tokens=max_completion_tokens,
+            reasoning_effort=reasoning_effort,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if chunk.usage:
+                # Usage arrives on the final chunk, which has no choices
+                usage = chunk.usage
+                _settle_tokens(messages, max_completion_tokens, usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                timer.mark_first_token()
+                pieces.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+    except GeneratorExit:
+        # Abandoned by the consumer, e.g. the losing request of a hedged pair;
+        # says nothing about the service's health
+        stream.close()
+        breaker.cancel_call()
+        if usage is None:
+            # Only the prompt and what was generated so far count against the limit
+            _refund_tokens(messages, max_completion_tokens,
+                           count_message_tokens(messages) + count_tokens("".join(pieces)))
+        record_call(call_site, topic_key, model, timer.elapsed(), usage=usage, first_token_latency=timer.first_token)
+        raise
+    except Exception as e:
+        # Errors before the stream opened were already reported by _create_with_retries
+        if stream is not None:
+            if isinstance(e, _stream_errors()):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if usage is None:
+                _refund_tokens(messages, max_completion_tokens,
+                               count_message_tokens(messages) + count_tokens("".join(pieces)))
+        record_call(call_site, topic_key, model, timer.elapsed(), error=e, first_token_latency=timer.first_token)
+        raise
+    breaker.record_success()
+    record_call(call_site, topic_key, model, timer.elapsed(), usage=usage, first_token_latency=timer.first_token)
+    if cache is not None:
+        cache.set(key, "".join(pieces))
+
+def _question_routes():
+    """The primary and hedge (faster, cheaper) model tiers for question generation."""
+    primary = {
+        'model': get_setting('routing', 'primary_model', "gpt-5"),
+        'reasoning_effort': get_setting('routing', 'primary_reasoning_effort', "minimal")
+    }
+    hedge = {
+        'model': get_setting('routing', 'hedge_model', "gpt-5-mini"),
+        'reasoning_effort': get_setting('routing', 'hedge_reasoning_effort', "minimal")
+    }
+    return primary, hedge
+
+def _hedged_stream(call_site, topic_key, messages, max_completion_tokens, cache_salt=None):
+    """
+    Stream a question from the primary model, hedging with a faster model.
+    
+    If the primary hasn't produced its first token within [routing]
+    hedge_delay seconds, or fails before then, the same request is sent to
+    the hedge model. No hedge is sent while questions are queued in the
+    rate limiter, where it would only add load. Whichever produces a first token first is streamed.
+    The other is closed as soon as its next chunk arrives; when the hedge
+    wins, that chunk also measures how much sooner the hedge answered.
+    The decision and the served time to first token are recorded per topic.
+    
+    Yields:
+        Text deltas from the winning request
+    """
+    primary, hedge = _question_routes()
+    if not get_setting('routing', 'hedging', True):
+        yield from _stream_text(call_site, topic_key, "question", messages, max_completion_tokens,
+                                primary['reasoning_effort'], cache_salt, model=primary['model'])
+        return
+    
+    hedge_delay = get_setting('routing', 'hedge_delay', 1.5)
+    hedge_at = hedge_delay
+    controller = get_admission_controller()
+    events = queue.Queue()
+    cancelled = {}
+    timer = Timer()
+    served = {}
+    
+    def start(name, route):
+        cancelled[name] = threading.Event()
+        deltas = _stream_text(call_site, topic_key, "question", messages, max_completion_tokens,
+                              route['reasoning_effort'], cache_salt, model=route['model'])
+        
+        def consume():
+            try:
+                for delta in deltas:
+                    if cancelled[name].is_set():
+                        if name == "primary" and served.get('winner') == "hedge":
+                            record_hedge_savings(call_site, topic_key, timer.elapsed() - served['latency'])
+                        deltas.close()
+                        return
+                    events.put((name, "delta", delta))
+            except Exception as e:
+                events.put((name, "error", e))
+                return
+            events.put((name, "done", None))
+        
+        threading.Thread(target=_with_script_run_ctx(consume), daemon=True).start()
+    
+    start("primary", primary)
+    hedged = False
+    failed = {}
+    try:
+        # Wait for the first token, sending the hedge once the delay passes
+        while True:
+            try:
+                name, kind, value = events.get(timeout=None if hedged else max(0, hedge_at - timer.elapsed()))
+            except queue.Empty:
+                if controller is not None and controller.queue_depth()['question'] > 0:
+                    # Questions (possibly the primary) are queued for capacity, so a
+                    # hedge would only add load; restart the hedge clock instead
+                    hedge_at = timer.elapsed() + hedge_delay
+                    continue
+                start("hedge", hedge)
+                hedged = True
+                continue
+            if kind == "delta":
+                break
+            # Failed (or finished empty) before its first token
+            failed[name] = value
+            if not hedged and isinstance(value, (AdmissionTimeout, CircuitOpen)):
+                # The hedge would be turned away the same way
+                raise value
+            if not hedged:
+                start("hedge", hedge)
+                hedged = True
+            elif len(failed) == 2:
+                raise failed["primary"] or failed["hedge"] or RuntimeError("Both routes returned nothing")
+        
+        winner = name
+        served.update(winner=winner, latency=timer.elapsed())
+        for other in cancelled:
+            if other != winner:
+                cancelled[other].set()
+        decision = "hedge" if winner == "hedge" else ("primary_after_hedge" if hedged else "primary")
+        record_route(call_site, topic_key, decision, served['latency'],
+                     slo=get_setting('routing', 'question_latency_slo', 3.0))
+        
+        yield value
+        while True:
+            name, kind, value = events.get()
+            if name != winner:
+                continue
+            if kind == "delta":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+    finally:
+        # Also stops both requests if our consumer goes away
+        for event in cancelled.values():
+            event.set()
+
+def _strip_question_prefix(deltas, question_number):
+    """Drop a leading "Question X:" prefix from streamed deltas."""
+    prefix = f"Question {question_number}:"
+    pending = ""
+    prefix_checked = False
+    for delta in deltas:
+        if not prefix_checked:
+            # Hold text back until we know whether it starts with the prefix
+            pending += delta
+            head = pending.lstrip()
+            if len(head) < len(prefix) and prefix.startswith(head):
+                continue
+            prefix_checked = True
+            delta = head[len(prefix):].lstrip() if head.startswith(prefix) else head
+            if not delta:
+                continue
+        yield delta
+    
+    if not prefix_checked and clean_question(pending, question_number):
+        yield clean_question(pending, question_number)
+
+def stream_question(topic_key, question_number, previous_responses=None, user_profile=None):
+    """
+    Stream a dynamic question as text deltas.
+    
+    Same arguments as generate_question, including the first-question cache.
+    A leading "Question X:" prefix is dropped, but callers should still pass
+    the joined text through clean_question before storing it.
+    
+    Yields:
+        Pieces of the generated question, or the fallback question on error
+    """
+    opening = question_number == 1 and not previous_responses
+    if opening:
+        cache = get_first_question_cache()
+        cache_key = first_question_key(topic_key, user_profile)
+        cached = cache.get(cache_key)
+        if cached:
+            yield personalize_question(cached, user_profile)
+            return
+    
+    generated = []
+    streamed = False
+    error = None
+    try:
+        # Opening questions are generated for the profile bucket so they can be shared
+        prompt_profile = anonymize_profile(user_profile) if opening else user_profile
+        messages = _question_messages(topic_key, question_number, previous_responses, prompt_profile)
+        deltas = _strip_question_prefix(_hedged_stream(
+            "stream_question", topic_key, messages, 300,
+            cache_salt=_opening_variant(cache, cache_key) if opening else None
+        ), question_number)
+        
+        def record(deltas):
+            for delta in deltas:
+                generated.append(delta)
+                yield delta
+        
+        deltas = record(deltas)
+        if opening:
+            deltas = personalize_stream(deltas, user_profile)
+        
+        for delta in deltas:
+            streamed = True
+            yield delta
+        
+        if opening and streamed:
+            cache.add(cache_key, clean_question("".join(generated), question_number))
+        
+    except Exception as e:
+        error = e
+    
+    if not streamed:
+        # Fall back to a banked question (served straight away while the circuit is open)
+        yield _fallback_question("stream_question", topic_key, question_number, error)
+
+def _stream_with_fallback(deltas, fallback, error_label, call_site, topic_key):
+    """Pass through streamed deltas, yielding fallback text if nothing arrived."""
+    streamed = False
+    try:
+        for delta in deltas:
+            if not streamed:
+                delta = delta.lstrip()
+                if not delta:
+                    continue
+            streamed = True
+            yield delta
+    except Exception as e:
+        st.error(f"Error generating {error_label}: {str(e)}")
+    
+    if not streamed:
+        record_fallback(call_site, topic_key)
+        yield fallback
+
+def stream_insight(topic_key, responses, user_profile=None):
+    """
+    Stream personalized insights as text deltas.
+    
+    Same arguments as generate_insight.
+    
+    Yields:
+        Pieces of the generated insights, or the fallback insight on error
+    """
+    messages = _session_messages(build_insight_messages, topic_key, responses, user_profile)
+    yield from _stream_with_fallback(
+        _stream_text("stream_insight", topic_key, "reflection", messages, 1000, "low"),
+        INSIGHT_FALLBACK, "insights", "stream_insight", topic_key
+    )
+
+def stream_summary(topic_key, responses, user_profile=None):
+    """
+    Stream a personalized summary as text deltas.
+    
+    Same arguments as generate_summary.
+    
+    Yields:
+        Pieces of the generated summary, or the fallback summary on error
+    """
+    messages = _session_messages(build_summary_messages, topic_key, responses, user_profile)
+    yield from _stream_with_fallback(
+        _stream_text("stream_summary", topic_key, "reflection", messages, 1000, "low"),
+        SUMMARY_FALLBACK, "summary", "stream_summary", topic_key
+    )
+
+def _with_script_run_ctx(func):
+    """Wrap func so it can use st.* calls from a worker thread of the current session."""
+    ctx = get_script_run_ctx()
+    
+    def wrapper(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(*args, **kwargs)
+    
+    return wrapper
+
+def prefetch_stream(deltas):
+    """
+    Start consuming a delta generator in a background thread.
+    
+    Lets a second stream (e.g. the summary) make progress while the first one
+    is being rendered.
+    
+    Returns:
+        Iterator over the same deltas, blocking until each one arrives
+    """
+    chunks = queue.Queue()
+    done = object()
+    
+    def consume():
+        try:
+            for delta in deltas:
+                chunks.put(delta)
+        finally:
+            chunks.put(done)
+    
+    threading.Thread(target=_with_script_run_ctx(consume), daemon=True).start()
+    
+    def replay():
+        while True:
+            delta = chunks.get()
+            if delta is done:
+                return
+            yield delta
+    
+    return replay()
+
+def generate_insight_and_summary(topic_key, responses, user_profile=None):
+    """
+    Generate insights and summary concurrently.
+    
+    Both requests are sent in parallel, so the wait is roughly the slower of
+    the two calls. Each keeps its own fallback text if it fails.
+    
+    Args:
+        topic_key: The key of the selected topic
+        responses: List of all user responses
+        user_profile: User profile information
+    
+    Returns:
+        Tuple of (insights, summary) strings
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        insight_future = executor.submit(
+            _with_script_run_ctx(generate_insight), topic_key, responses, user_profile
+        )
+        summary_future = executor.submit(
+            _with_script_run_ctx(generate_summary), topic_key, responses, user_profile
+        )
+        return insight_future.result(), summary_future.result()
+
+# JSON schema for the combined end-of-session reflection
+REFLECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "insights": {"type": "string"},
+        "summary": {"type": "string"}
+    },
+    "required": ["insights", "summary"],
+    "additionalProperties": False
+}
+
+def _parse_reflection(content):
+    """Parse and validate the combined reflection JSON, returning (insights, summary)."""
+    data = json.loads(content)
+    insights = data.get("insights") if isinstance(data, dict) else None
+    summary = data.get("summary") if isinstance(data, dict) else None
+    if not isinstance(insights, str) or not insights.strip():
+        raise ValueError("Reflection is missing insights")
+    if not isinstance(summary, str) or not summary.strip():
+        raise ValueError("Reflection is missing summary")
+    return insights.strip(), summary.strip()
+
+def generate_reflection(topic_key, responses, user_profile=None):
+    """
+    Generate insights and summary together in a single structured call.
+    
+    The topic prompt, profile and responses are only sent once. If the call
+    fails or its output does not match REFLECTION_SCHEMA, falls back to
+    generating insights and summary as two separate calls.
+    
+    Args:
+        topic_key: The key of the selected topic
+        responses: List of all user responses
+        user_profile: User profile information
+    
+    Returns:
+        Tuple of (insights, summary) strings
+    """
+    try:
+        messages = _session_messages(build_reflection_messages, topic_key, responses, user_profile)
+        
+        # Generate insights and summary in one call
+        response = _create_completion(
+            "reflection",
+            "generate_reflection",
+            topic_key,
+            model="gpt-5",
+            messages=messages,
+            max_completion_tokens=2000,
+            reasoning_effort="low",
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "session_reflection",
+                    "strict": True,
+                    "schema": REFLECTION_SCHEMA
+                }
+            }
+        )
+        
+        return _parse_reflection(response.choices[0].message.content)
+        
+    except Exception:
+        # Fall back to the two-call path, which has its own per-call fallbacks
+        record_fallback("generate_reflection", topic_key)
+        return generate_insight_and_summary(topic_key, responses, user_profile)
+
+def build_question_bank(path, variants=3, total_questions=5, model="gpt-5-mini", concurrency=4, on_progress=None):
+    """
+    Generate stand-alone questions for every topic and question number and
+    write them to a question bank file.
+    
+    Args:
+        path: Question bank file to write
+        variants: Questions generated per topic and question number
+        total_questions: Questions per exercise
+        model: Model to generate with
+        concurrency: Requests in flight at once
+        on_progress: Callable (topic_key, question_number, questions) run as each slot finishes
+    
+    Returns:
+        Dictionary mapping topic key to a list of question variants per question number
+    """
+    def generate(topic_key, question_number):
+        messages = build_bank_question_messages(topic_key, question_number, total_questions)
+        questions = []
+        for variant in range(variants):
+            completion = _create_completion(
+                "question",
+                "build_question_bank",
+                topic_key,
+                cache_salt=f"bank-variant-{variant}",
+                model=model,
+                messages=messages,
+                max_completion_tokens=300,
+                reasoning_effort="minimal"
+            )
+            question = clean_question(completion.choices[0].message.content, question_number)
+            if question and question not in questions:
+                questions.append(question)
+        if on_progress:
+            on_progress(topic_key, question_number, questions)
+        return questions
+    
+    slots = [(topic_key, number) for topic_key, _ in get_topic_list() for number in range(1, total_questions + 1)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda slot: generate(*slot), slots))
+    
+    topics = {}
+    for (topic_key, _), questions in zip(slots, results):
+        topics.setdefault(topic_key, []).append(questions)
+    save_question_bank(path, topics, model)
+    return topics
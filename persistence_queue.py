@@ -0,0 +1,411 @@
+"""
+Write-behind persistence for the Relationship Reflection App.
+
+Button handlers enqueue write jobs and return immediately; a background
+worker drains the bounded queue, coalesces waiting jobs into a single
+Firestore batch and retries failed commits with jittered exponential
+backoff. Every job is appended to a local spill file before it is queued
+and marked done once committed, so jobs still pending after a crash or
+restart are replayed on the next start.
+
+Each queue journals to its own spill file next to the configured path and
+holds an exclusive lock on it while the process is alive. On start, spill
+files whose lock is free belong to processes that have exited; their
+pending jobs are claimed into the new file and the orphan is removed, so
+a job is never replayed while another live process still has it in flight.
+"""
+
+import json
+import logging
+import os
+import re
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks (Windows): orphaned spill files aren't claimed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Once idle, the spill file is emptied when it grows beyond this size
+SPILL_TRUNCATE_BYTES = 1024 * 1024
+
+class QueueFull(Exception):
+    """Raised when a job can't be queued because the queue is full."""
+
+class _StageError(Exception):
+    """A job's writes couldn't be added to a batch."""
+
+def _encode(value):
+    """JSON default hook that keeps datetimes round-trippable."""
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Can't serialize {type(value).__name__}")
+
+def _decode(value):
+    if "__datetime__" in value:
+        return datetime.fromisoformat(value["__datetime__"])
+    return value
+
+class PersistenceQueue:
+    """Bounded in-process queue with a background batching writer."""
+
+    def __init__(self, get_db, stage_job, on_flush=None, already_applied=None, spill_path=None, max_size=1000,
+                 batch_size=100, flush_interval=0.2, max_retries=8,
+                 retry_base_delay=0.5, retry_max_delay=30, enqueue_timeout=0.5):
+        """
+        Args:
+            get_db: Callable returning the Firestore client
+            stage_job: Callable (batch, db, job) adding a job's writes to a batch
+            on_flush: Callable (jobs) run after each successful commit
+            already_applied: Callable (error) that is true when a commit failed
+                because a job's writes were already applied, e.g. by a commit
+                that succeeded but reported an error, or before a crash
+            spill_path: Base path for the per-process spill files that pending
+                jobs are journalled to, or None
+            max_size: Maximum number of queued jobs
+            batch_size: Maximum number of jobs committed per batch
+            flush_interval: Seconds to wait for more jobs before committing
+            max_retries: Batch commit attempts before jobs are committed one at
+                a time, or parked and retried later if they all fail
+            retry_base_delay: First backoff delay in seconds
+            retry_max_delay: Largest backoff delay in seconds
+            enqueue_timeout: Seconds enqueue waits for room before raising QueueFull
+        """
+        self.get_db = get_db
+        self.stage_job = stage_job
+        self.on_flush = on_flush
+        self.already_applied = already_applied
+        self.spill_base = spill_path
+        self.spill_path = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_size)
+        self._spill_lock = threading.Lock()
+        self._idle = threading.Condition()
+        self._in_flight = 0
+        self._stats = {'enqueued': 0, 'committed': 0, 'batches': 0, 'retries': 0, 'failed': 0,
+                       'dead_lettered': 0}
+        self._thread = None
+        self._spill_lock_file = None
+        self._parked = set()  # ids of jobs waiting to be retried after their batch failed
+        self._park_rounds = 0
+
+    def start(self):
+        """Start the worker thread and replay jobs left by exited processes."""
+        pending = self._open_spill()
+        self._thread = threading.Thread(target=self._run, name="persistence-queue", daemon=True)
+        self._thread.start()
+        for job in pending:
+            self._queue.put(job)
+        return self
+
+    def enqueue(self, job):
+        """
+        Journal a job and queue it for writing.
+
+        Args:
+            job: JSON-serializable dict (datetimes allowed) understood by stage_job
+
+        Raises:
+            QueueFull: If the queue stays full for enqueue_timeout seconds
+        """
+        job = dict(job, job_id=job.get('job_id') or str(uuid.uuid4()))
+        with self._idle:
+            self._in_flight += 1
+        self._append_spill({'job': job})
+        try:
+            self._queue.put(job, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._append_spill({'done': job['job_id']})
+            self._job_finished(1)
+            raise QueueFull("Persistence queue is full")
+        self._stats['enqueued'] += 1
+        return job['job_id']
+
+    def wait_until_idle(self, timeout=None):
+        """Block until every queued job has been committed, dead-lettered or parked."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def stats(self):
+        """
+        Queue depth plus counts of enqueued, committed, retried and
+        dead-lettered jobs, and of failed jobs waiting to be retried.
+        """
+        return dict(self._stats, depth=self._queue.qsize())
+
+    def _job_finished(self, count):
+        with self._idle:
+            self._in_flight -= count
+            self._idle.notify_all()
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            # Coalesce whatever else arrives shortly into the same batch
+            deadline = time.monotonic() + self.flush_interval
+            while len(jobs) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    jobs.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(jobs)
+            self._job_finished(len(jobs))
+            self._truncate_spill_if_idle()
+
+    def _flush(self, jobs):
+        """
+        Commit jobs in one batch, retrying with backoff.
+
+        If the batch fails for good, or because some of its jobs were already
+        applied, its jobs are committed one at a time so a single bad job
+        can't hold back the rest. Already applied jobs count as done. A job that still fails
+        while others commit, or that can't be staged at all, is moved to the
+        dead-letter file; if every job fails the backend is likely down and
+        they are parked and queued again after a backoff.
+        """
+        error = self._commit_with_retries(jobs, self.max_retries)
+        if error is None:
+            self._committed(jobs)
+            return
+
+        if len(jobs) > 1:
+            logger.warning("Batch of %d job(s) failed, committing them one at a time", len(jobs))
+            results = [(job, self._commit_with_retries([job], 1)) for job in jobs]
+            self._committed([job for job, job_error in results if job_error is None])
+        else:
+            results = [(jobs[0], error)]
+        applied = [job for job, job_error in results if self._already_applied(job_error)]
+        if applied:
+            logger.info("Skipping %d job(s) that were already applied", len(applied))
+            self._committed(applied)
+        failed = [(job, job_error) for job, job_error in results
+                  if job_error is not None and not self._already_applied(job_error)]
+        isolated = len(failed) < len(results)
+
+        kept = []
+        for job, job_error in failed:
+            if isolated or isinstance(job_error, _StageError):
+                self._dead_letter(job, job_error)
+            else:
+                kept.append(job)
+        if kept:
+            self._park(kept)
+
+    def _park(self, jobs):
+        """
+        Set jobs aside after their batch failed for good and queue them again later.
+
+        The backend is likely down, so each round waits twice as long as the
+        last, up to retry_max_delay. Parked jobs stay in the spill file, so
+        they are still replayed if the process exits first.
+        """
+        with self._idle:
+            new = [job for job in jobs if job['job_id'] not in self._parked]
+            self._parked.update(job['job_id'] for job in jobs)
+            self._stats['failed'] += len(new)
+            delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** self._park_rounds)
+            self._park_rounds += 1
+        logger.error("Persisting %d job(s) failed after %d attempts; retrying in %.1fs",
+                     len(jobs), self.max_retries, delay)
+        timer = threading.Timer(delay, self._requeue, [jobs])
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, jobs):
+        with self._idle:
+            self._in_flight += len(jobs)
+        for job in jobs:
+            self._queue.put(job)
+
+    def _unpark(self, jobs):
+        """Stop counting jobs as failed once they are committed or dead-lettered."""
+        with self._idle:
+            for job in jobs:
+                if job['job_id'] in self._parked:
+                    self._parked.discard(job['job_id'])
+                    self._stats['failed'] -= 1
+
+    def _commit(self, jobs):
+        db = self.get_db()
+        batch = db.batch()
+        for job in jobs:
+            try:
+                self.stage_job(batch, db, job)
+            except Exception as e:
+                raise _StageError(f"Can't stage job {job['job_id']}: {e}") from e
+        batch.commit()
+
+    def _commit_with_retries(self, jobs, attempts):
+        """Commit jobs in one batch, returning the last error or None once committed."""
+        error = None
+        for attempt in range(attempts):
+            try:
+                self._commit(jobs)
+                return None
+            except _StageError as e:
+                # Bad job data; retrying won't help
+                return e
+            except Exception as e:
+                if self._already_applied(e):
+                    return e
+                error = e
+                logger.warning("Persisting %d job(s) failed (attempt %d)", len(jobs), attempt + 1, exc_info=True)
+                self._stats['retries'] += 1
+                if attempt + 1 < attempts:
+                    # Exponential backoff with full jitter
+                    time.sleep(random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt)))
+        return error
+
+    def _already_applied(self, error):
+        return error is not None and self.already_applied is not None and self.already_applied(error)
+
+    def _committed(self, jobs):
+        """Record committed jobs as done and run the flush callback."""
+        if not jobs:
+            return
+        with self._idle:
+            self._park_rounds = 0
+        self._unpark(jobs)
+        self._stats['committed'] += len(jobs)
+        self._stats['batches'] += 1
+        for job in jobs:
+            self._append_spill({'done': job['job_id']})
+        if self.on_flush:
+            try:
+                self.on_flush(jobs)
+            except Exception:
+                logger.warning("Persistence flush callback failed", exc_info=True)
+
+    def _dead_letter(self, job, error):
+        """Set a job that can't be written aside in the dead-letter file and mark it done."""
+        self._stats['dead_lettered'] += 1
+        self._unpark([job])
+        logger.error("Moving job %s to the dead-letter file: %s", job['job_id'], error)
+        if not self.spill_base:
+            return
+        root, ext = os.path.splitext(self.spill_base)
+        record = {'job': job, 'error': repr(error), 'failed_at': datetime.now()}
+        with self._spill_lock:
+            # Shared by all processes; single appended lines don't interleave
+            with open(f"{root}.dead{ext}", 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, default=_encode) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self._append_spill({'done': job['job_id']})
+
+    def _append_spill(self, record):
+        if not self.spill_path:
+            return
+        with self._spill_lock:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, default=_encode) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _truncate_spill_if_idle(self):
+        """Empty the spill file once nothing is pending and it has grown."""
+        if not self.spill_path:
+            return
+        with self._spill_lock:
+            with self._idle:
+                idle = self._in_flight == 0
+            if idle and self._stats['failed'] == 0 and os.path.exists(self.spill_path) \
+                    and os.path.getsize(self.spill_path) > SPILL_TRUNCATE_BYTES:
+                open(self.spill_path, 'w').close()
+
+    def _spill_files(self):
+        """Spill files for the configured base path, including the legacy shared file."""
+        directory = os.path.dirname(self.spill_base) or "."
+        root, ext = os.path.splitext(os.path.basename(self.spill_base))
+        pattern = re.compile(re.escape(root) + r"\.\d+-[0-9a-f]+" + re.escape(ext))
+        names = [name for name in os.listdir(directory) if pattern.fullmatch(name)]
+        names.append(os.path.basename(self.spill_base))
+        return [os.path.join(directory, name) for name in names]
+
+    def _open_spill(self):
+        """
+        Create and lock this process's spill file and claim orphaned jobs into it.
+
+        Returns:
+            The claimed jobs, to be replayed
+        """
+        if not self.spill_base:
+            return []
+        root, ext = os.path.splitext(self.spill_base)
+        self.spill_path = f"{root}.{os.getpid()}-{uuid.uuid4().hex[:8]}{ext}"
+        # Held open for the life of the process; the lock is released when it exits
+        self._spill_lock_file = open(self.spill_path, 'a', encoding='utf-8')
+        if fcntl is not None:
+            fcntl.flock(self._spill_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        pending = {}
+        if fcntl is not None:
+            for path in self._spill_files():
+                if path != self.spill_path:
+                    for job in self._claim_spill(path):
+                        pending.setdefault(job['job_id'], job)
+        jobs = list(pending.values())
+        for job in jobs:
+            self._append_spill({'job': job})
+        with self._idle:
+            self._in_flight += len(jobs)
+        if jobs:
+            logger.info("Replaying %d pending job(s) from exited processes", len(jobs))
+        return jobs
+
+    def _claim_spill(self, path):
+        """Read the pending jobs of another process's spill file if that process has exited."""
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return []
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Locked by a live process
+                return []
+            try:
+                # Another process may have claimed and removed it after we opened it
+                if os.stat(path).st_ino != os.fstat(f.fileno()).st_ino:
+                    return []
+            except FileNotFoundError:
+                return []
+            pending = _read_pending(f)
+            # Journalled into our own file before the orphan goes, so a crash in
+            # between replays them twice rather than not at all
+            for job in pending:
+                self._append_spill({'job': job})
+            os.remove(path)
+            return pending
+
+def _read_pending(f):
+    """Jobs in a spill file without a done record."""
+    pending = {}
+    for line in f:
+        try:
+            record = json.loads(line, object_hook=_decode)
+        except ValueError:
+            # Torn final line from a crash mid-write
+            continue
+        if 'job' in record:
+            pending[record['job']['job_id']] = record['job']
+        elif 'done' in record:
+            pending.pop(record['done'], None)
+    return list(pending.values())
@@ -0,0 +1,242 @@
+"""
+Chat message builders for the Relationship Reflection App.
+
+Messages are laid out so providers can reuse cached prompt prefixes: the
+normalized topic prompt always comes first, followed by the per-user
+profile and responses, with the task-specific request last. Insights,
+summary and the combined reflection therefore share the prefix up to and
+including the user's responses, and every question in a session extends
+the prefix of the one before it.
+"""
+
+import re
+import textwrap
+from questions import get_topic_prompt
+
+def normalize_prompt(text):
+    """Dedent and strip text so the same prompt is always sent byte-for-byte."""
+    text = textwrap.dedent(text).strip()
+    return re.sub(r"[ \t]+\n", "\n", text)
+
+QUESTION_INSTRUCTIONS = normalize_prompt("""
+    Please personalize the questions based on the user's profile when appropriate. Address the user by name when appropriate, and thank them for sharing when appropriate.
+""")
+
+INSIGHT_INSTRUCTIONS = normalize_prompt("""
+    Based on the user's responses, generate 2-3 key insights that:
+    1. Reveal patterns or themes in their responses
+    2. Offer gentle, supportive observations about their relationship dynamics
+    3. Highlight strengths and areas for growth
+    4. Are specific to what they shared, not generic advice
+    5. Are warm, empathetic, and non-judgmental
+    6. Help them see their situation with fresh perspective
+
+    Format as 2-3 bullet points starting with "•"
+""")
+
+SUMMARY_INSTRUCTIONS = normalize_prompt("""
+    Based on the user's responses, create a thoughtful summary that:
+    1. Identifies key themes and patterns
+    2. Offers gentle insights without being prescriptive
+    3. Highlights what might really be at stake
+    4. Is supportive and non-judgmental
+    5. Is 2-3 paragraphs long
+""")
+
+REFLECTION_INSTRUCTIONS = normalize_prompt("""
+    Based on the user's responses, return a JSON object with two fields.
+
+    "insights": 2-3 key insights that:
+    1. Reveal patterns or themes in their responses
+    2. Offer gentle, supportive observations about their relationship dynamics
+    3. Highlight strengths and areas for growth
+    4. Are specific to what they shared, not generic advice
+    5. Are warm, empathetic, and non-judgmental
+    6. Help them see their situation with fresh perspective
+    Format as 2-3 bullet points starting with "•"
+
+    "summary": a thoughtful summary that:
+    1. Identifies key themes and patterns
+    2. Offers gentle insights without being prescriptive
+    3. Highlights what might really be at stake
+    4. Is supportive and non-judgmental
+    5. Is 2-3 paragraphs long
+""")
+
+BANK_QUESTION_INSTRUCTIONS = normalize_prompt("""
+    You are writing backup questions for this reflection exercise, asked when a personalized question can't be generated.
+    The user's profile and earlier answers won't be known, so the question must stand on its own: don't address the user by name or refer to anything they said.
+    Reply with the question only.
+""")
+
+DIGEST_INSTRUCTIONS = normalize_prompt("""
+    You maintain a compact running digest of a user's answers in a relationship reflection exercise.
+    Merge the new answers into the existing digest. Keep concrete details, feelings and names that later questions might build on, drop filler, and keep the whole digest under 150 words.
+    Reply with the updated digest only.
+""")
+
+def _topic_message(topic_key):
+    """The static system message every call starts with."""
+    return {
+        "role": "system",
+        "content": normalize_prompt(get_topic_prompt(topic_key))
+    }
+
+def _profile_message(user_profile, include_name=True):
+    """The per-user profile block, placed after the static prefix."""
+    lines = ["User Profile:"]
+    if include_name:
+        lines.append(f"- Name: {user_profile.get('name', 'User')}")
+    lines.append(f"- Age: {user_profile.get('age', 'Unknown')}")
+    lines.append(f"- Relationship Status: {user_profile.get('relationship_status', 'Unknown')}")
+    return {
+        "role": "system",
+        "content": "\n".join(lines)
+    }
+
+def _digest_message(digest, first_recent_number):
+    """Digest of the responses that were compacted out of the prompt."""
+    return {
+        "role": "system",
+        "content": f"Digest of the user's earlier responses (1-{first_recent_number - 1}):\n{digest}"
+    }
+
+def _responses_message(responses, digest=None, start_number=1):
+    """All of the user's responses (or a digest plus the recent ones) as a single user message."""
+    parts = []
+    if digest:
+        parts.append(f"Digest of responses 1-{start_number - 1}: {digest}")
+    parts.extend(f"Response {i}: {response.strip()}" for i, response in enumerate(responses, start_number))
+    responses_text = "\n\n".join(parts)
+    return {
+        "role": "user",
+        "content": f"Here are my responses to the reflection questions:\n\n{responses_text}"
+    }
+
+def build_question_messages(topic_key, question_number, previous_responses=None, user_profile=None,
+                            digest=None, start_number=1):
+    """
+    Build the chat messages for generating a question.
+
+    When older responses have been compacted, pass their digest and the
+    number of the first response in previous_responses as start_number.
+    """
+    messages = [
+        _topic_message(topic_key),
+        {
+            "role": "system",
+            "content": QUESTION_INSTRUCTIONS
+        }
+    ]
+
+    # Add user profile context if available
+    if user_profile:
+        messages.append(_profile_message(user_profile))
+
+    # Add the digest of compacted responses, if any
+    if digest:
+        messages.append(_digest_message(digest, start_number))
+
+    # Add previous responses for context
+    if previous_responses:
+        for i, response in enumerate(previous_responses, start_number):
+            messages.extend([
+                {
+                    "role": "assistant",
+                    "content": f"Question {i}: [Previous question was asked here]"
+                },
+                {
+                    "role": "user",
+                    "content": response.strip()
+                }
+            ])
+
+    # Request the next question
+    if question_number == 1:
+        request_message = "Please ask the first question to start this reflection exercise."
+    else:
+        request_message = f"Based on the user's previous responses, please ask question {question_number} that builds naturally on what they've shared so far."
+
+    messages.append({
+        "role": "user",
+        "content": request_message
+    })
+
+    return messages
+
+def _build_session_messages(topic_key, responses, user_profile, instructions, request_message,
+                            digest=None, start_number=1):
+    """Shared layout for the end-of-session calls: prefix, profile, responses, then the task."""
+    messages = [_topic_message(topic_key)]
+
+    # Add user profile if available
+    if user_profile:
+        messages.append(_profile_message(user_profile, include_name=False))
+
+    messages.extend([
+        _responses_message(responses, digest, start_number),
+        {
+            "role": "system",
+            "content": instructions
+        },
+        {
+            "role": "user",
+            "content": request_message
+        }
+    ])
+
+    return messages
+
+def build_insight_messages(topic_key, responses, user_profile=None, digest=None, start_number=1):
+    """Build the chat messages for generating insights."""
+    return _build_session_messages(
+        topic_key, responses, user_profile, INSIGHT_INSTRUCTIONS,
+        "Please provide key insights about my relationship patterns and dynamics.",
+        digest, start_number
+    )
+
+def build_summary_messages(topic_key, responses, user_profile=None, digest=None, start_number=1):
+    """Build the chat messages for generating a summary."""
+    return _build_session_messages(
+        topic_key, responses, user_profile, SUMMARY_INSTRUCTIONS,
+        "Please provide a thoughtful summary of my reflections.",
+        digest, start_number
+    )
+
+def build_reflection_messages(topic_key, responses, user_profile=None, digest=None, start_number=1):
+    """Build the chat messages for generating insights and summary together."""
+    return _build_session_messages(
+        topic_key, responses, user_profile, REFLECTION_INSTRUCTIONS,
+        "Please provide key insights and a thoughtful summary of my reflections.",
+        digest, start_number
+    )
+
+def build_bank_question_messages(topic_key, question_number, total_questions=5):
+    """Build the chat messages for generating a stand-alone question for the question bank."""
+    return [
+        _topic_message(topic_key),
+        {
+            "role": "system",
+            "content": BANK_QUESTION_INSTRUCTIONS
+        },
+        {
+            "role": "user",
+            "content": f"Please ask question {question_number} of {total_questions}, going a little deeper than the questions before it."
+        }
+    ]
+
+def build_digest_messages(previous_digest, first_number, responses):
+    """Build the chat messages for folding new responses into the rolling digest."""
+    answers = "\n\n".join(
+        f"Response {number}:\n{response.strip()}" for number, response in enumerate(responses, first_number)
+    )
+    return [
+        {
+            "role": "system",
+            "content": DIGEST_INSTRUCTIONS
+        },
+        {
+            "role": "user",
+            "content": f"Existing digest:\n{previous_digest or '(empty)'}\n\nNew answers:\n{answers}"
+        }
+    ]
@@ -0,0 +1,61 @@
+"""
+Precomputed question bank for the Relationship Reflection App.
+
+A few stand-alone questions per topic and question number, generated
+offline from questions.TOPICS by build_question_bank.py and shipped as a
+compact JSON file. The bank is loaded once per process and used when a
+question can't be generated, e.g. while the LLM circuit is open, so users
+still get a topic-specific question instead of a generic one.
+"""
+
+import json
+import logging
+import os
+import random
+import streamlit as st
+from config import get_setting
+
+logger = logging.getLogger(__name__)
+
+BANK_VERSION = 1
+
+DEFAULT_BANK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_bank.json")
+
+@st.cache_resource
+def load_question_bank():
+    """
+    Load the question bank once per process.
+
+    Returns:
+        Dictionary mapping topic key to a list (one entry per question
+        number) of question variants; empty if the file is missing or invalid
+    """
+    path = get_setting('openai', 'question_bank_path', DEFAULT_BANK_PATH)
+    try:
+        with open(path, encoding='utf-8') as f:
+            bank = json.load(f)
+    except FileNotFoundError:
+        logger.warning("No question bank at %s; run build_question_bank.py to create it", path)
+        return {}
+    except ValueError:
+        logger.warning("Question bank at %s is not valid JSON", path, exc_info=True)
+        return {}
+    if bank.get('version') != BANK_VERSION:
+        logger.warning("Question bank at %s has unsupported version %s", path, bank.get('version'))
+        return {}
+    return bank.get('topics', {})
+
+def bank_question(topic_key, question_number):
+    """Get a random banked question for a topic and question number (1-based), or None."""
+    questions = load_question_bank().get(topic_key, [])
+    if not 1 <= question_number <= len(questions) or not questions[question_number - 1]:
+        return None
+    return random.choice(questions[question_number - 1])
+
+def save_question_bank(path, topics, model):
+    """Write a question bank file compactly and atomically."""
+    bank = {'version': BANK_VERSION, 'model': model, 'topics': topics}
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(bank, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temp_path, path)
@@ -0,0 +1,141 @@
+"""
+Shared cache of opening questions for the Relationship Reflection App.
+
+Question 1 only depends on the topic prompt and a few profile fields, so
+opening questions are generated once per topic and coarse profile bucket
+and reused across sessions. Each bucket holds a small pool of variants so
+users still see some variety, and the user's name is filled in locally.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+import streamlit as st
+from config import get_setting
+
+# Stands in for the user's name when generating a shareable question
+NAME_PLACEHOLDER = "[NAME]"
+
+class FirstQuestionCache:
+    """Bounded LRU cache mapping a profile bucket to a pool of question variants."""
+
+    def __init__(self, max_keys=256, ttl=24 * 60 * 60, variants=5):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.variants = variants
+        self._entries = OrderedDict()  # key -> (created_at, [questions])
+        self._attempts = OrderedDict()  # key -> variant generation attempts so far
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return a random variant for key once its pool is full, otherwise None.
+
+        Until the pool is full, callers generate a fresh question and add it,
+        so early sessions for a bucket still grow the variety.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, pool = entry
+            if time.monotonic() - created_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            if len(pool) < self.variants:
+                return None
+            return random.choice(pool)
+
+    def fill_attempt(self, key):
+        """
+        Number the next attempt to generate a variant for key.
+
+        Attempts are numbered even when the generated question turns out to
+        be a duplicate, so each one can be sent as a distinct request.
+        """
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+            self._attempts.move_to_end(key)
+            while len(self._attempts) > self.max_keys:
+                self._attempts.popitem(last=False)
+            return attempt
+
+    def add(self, key, question):
+        """Add a generated question to the pool for key, evicting the least recently used bucket."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                entry = (time.monotonic(), [])
+                self._entries[key] = entry
+            pool = entry[1]
+            if question not in pool and len(pool) < self.variants:
+                pool.append(question)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+
+@st.cache_resource
+def get_first_question_cache():
+    """Get the process-wide opening question cache."""
+    return FirstQuestionCache(
+        max_keys=get_setting('openai', 'first_question_cache_size', 256),
+        ttl=get_setting('openai', 'first_question_cache_ttl', 24 * 60 * 60),
+        variants=get_setting('openai', 'first_question_variants', 5)
+    )
+
+def age_band(age):
+    """Map an age to a coarse band used for cache keys."""
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return "unknown"
+    if age < 25:
+        return "18-24"
+    if age >= 65:
+        return "65+"
+    low = (age - 25) // 10 * 10 + 25
+    return f"{low}-{low + 9}"
+
+def first_question_key(topic_key, user_profile=None):
+    """Build the cache key for a topic and profile bucket."""
+    user_profile = user_profile or {}
+    return (
+        topic_key,
+        age_band(user_profile.get('age')),
+        user_profile.get('relationship_status', 'Unknown')
+    )
+
+def anonymize_profile(user_profile=None):
+    """Return the bucketed profile used to generate a shareable opening question."""
+    user_profile = user_profile or {}
+    return {
+        'name': NAME_PLACEHOLDER,
+        'age': age_band(user_profile.get('age')),
+        'relationship_status': user_profile.get('relationship_status', 'Unknown')
+    }
+
+def personalize_question(question, user_profile=None):
+    """Fill the user's name into a cached opening question."""
+    name = (user_profile or {}).get('name', '').strip() or "there"
+    return question.replace(NAME_PLACEHOLDER, name)
+
+def personalize_stream(deltas, user_profile=None):
+    """Fill the user's name into streamed deltas, even when the placeholder spans chunks."""
+    carry = ""
+    for delta in deltas:
+        text = carry + delta
+        # Hold back any trailing text that could be the start of the placeholder
+        keep = 0
+        for size in range(min(len(NAME_PLACEHOLDER) - 1, len(text)), 0, -1):
+            if NAME_PLACEHOLDER.startswith(text[-size:]):
+                keep = size
+                break
+        carry = text[len(text) - keep:] if keep else ""
+        text = text[:len(text) - keep]
+        if text:
+            yield personalize_question(text, user_profile)
+    if carry:
+        yield personalize_question(carry, user_profile)
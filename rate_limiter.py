@@ -0,0 +1,154 @@
+"""
+Process-wide admission control for the Relationship Reflection App's LLM calls.
+
+Every OpenAI request first takes one request from a requests-per-minute
+token bucket and its estimated tokens from a tokens-per-minute bucket,
+shared by all sessions in the process. When the buckets are empty,
+callers queue instead of running into provider 429s. Waiters are
+admitted strictly by priority class, then in arrival order, so
+interactive questions go ahead of end-of-session insights and summaries.
+A caller that can't be admitted within its class's maximum wait gets
+AdmissionTimeout and falls back like any other failed call.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import streamlit as st
+from config import get_setting
+from llm_metrics import record_admission
+
+# Priority classes, highest first; they match the call types of openai_utils
+PRIORITY_CLASSES = ("question", "reflection")
+
+class AdmissionTimeout(Exception):
+    """Raised when a call waited its class's maximum wait without being admitted."""
+
+class TokenBucket:
+    """Refills continuously at rate_per_minute, up to capacity."""
+
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount):
+        """Seconds until amount is available (after refill)."""
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        # May go negative when settling an under-estimate; later callers wait it out
+        self.level -= amount
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+class AdmissionController:
+    """Priority-ordered admission against request and token rate limits."""
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=200000, burst_seconds=10, max_wait=None):
+        """
+        Args:
+            requests_per_minute: Sustained request rate
+            tokens_per_minute: Sustained token rate (prompt plus completion)
+            burst_seconds: Seconds of each rate that can be used at once
+            max_wait: Dictionary mapping priority class to the longest wait
+                in seconds before AdmissionTimeout
+        """
+        self.requests = TokenBucket(requests_per_minute, max(1, requests_per_minute * burst_seconds / 60))
+        self.tokens = TokenBucket(tokens_per_minute, max(1, tokens_per_minute * burst_seconds / 60))
+        self.max_wait = max_wait or {}
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._depth = {name: 0 for name in PRIORITY_CLASSES}
+        self._condition = threading.Condition()
+
+    def acquire(self, priority_class, tokens, call_site=None):
+        """
+        Wait until a call may go ahead, then take its share of both rate limits.
+
+        Args:
+            priority_class: One of PRIORITY_CLASSES
+            tokens: Estimated prompt plus completion tokens of the call
+            call_site: Name of the calling function, for metrics
+
+        Returns:
+            Seconds waited
+
+        Raises:
+            AdmissionTimeout: If not admitted within the class's maximum wait
+        """
+        tokens = min(tokens, self.tokens.capacity)
+        start = time.monotonic()
+        deadline = start + self.max_wait.get(priority_class, 10)
+        entry = (PRIORITY_CLASSES.index(priority_class), next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiters, entry)
+            self._depth[priority_class] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = None
+                    if self._waiters[0] == entry:
+                        self.requests.refill(now)
+                        self.tokens.refill(now)
+                        delay = max(self.requests.time_until(1), self.tokens.time_until(tokens))
+                        if delay == 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            break
+                    if now >= deadline:
+                        record_admission(priority_class, call_site, now - start, admitted=False)
+                        raise AdmissionTimeout(f"No LLM capacity for a {priority_class} call within "
+                                               f"{deadline - start:.1f}s")
+                    # Only the head of the queue waits for a refill; the others for their turn
+                    self._condition.wait(deadline - now if delay is None else min(delay, deadline - now))
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._depth[priority_class] -= 1
+                self._condition.notify_all()
+        waited = time.monotonic() - start
+        record_admission(priority_class, call_site, waited, admitted=True)
+        return waited
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Correct the token bucket once a call's actual usage is known."""
+        with self._condition:
+            difference = min(estimated_tokens, self.tokens.capacity) - actual_tokens
+            if difference > 0:
+                self.tokens.give_back(difference)
+                self._condition.notify_all()
+            else:
+                self.tokens.take(-difference)
+
+    def queue_depth(self):
+        """Callers currently waiting, per priority class."""
+        with self._condition:
+            return dict(self._depth)
+
+@st.cache_resource
+def get_admission_controller():
+    """
+    Get the process-wide admission controller for OpenAI calls.
+
+    Returns:
+        The controller, or None when [rate_limit] enabled is false
+    """
+    if not get_setting('rate_limit', 'enabled', True):
+        return None
+    return AdmissionController(
+        requests_per_minute=get_setting('rate_limit', 'requests_per_minute', 500),
+        tokens_per_minute=get_setting('rate_limit', 'tokens_per_minute', 200000),
+        burst_seconds=get_setting('rate_limit', 'burst_seconds', 10),
+        max_wait={
+            'question': get_setting('rate_limit', 'question_max_wait', 5),
+            'reflection': get_setting('rate_limit', 'reflection_max_wait', 20)
+        }
+    )
@@ -0,0 +1,141 @@
+"""
+Disk-backed cache of LLM responses for the Relationship Reflection App.
+
+Completions are cached in a SQLite file keyed by a SHA-256 hash of the
+canonical JSON of (model, messages, params), so a repeated request (a
+double-click, a rerun that regenerates the current question, a replayed
+session) is answered from disk. Entries expire after a TTL and the least
+recently used ones are evicted beyond a size bound. In "replay" mode
+misses raise instead of calling the API, so test and benchmark runs can
+replay recorded sessions deterministically without network access.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import streamlit as st
+from config import get_setting, use_fake_backends
+
+# Cache modes: read and write, serve recorded responses only, or disabled
+MODES = ("readwrite", "replay", "off")
+
+# Parameters that change how a response is delivered, not what it says
+_TRANSPORT_PARAMS = {"stream", "stream_options", "timeout"}
+
+class ResponseCacheMiss(Exception):
+    """Raised in replay mode when a request has no recorded response."""
+
+def request_key(model, messages, params=None):
+    """
+    Hash a request canonically, so equal requests always get the same key.
+
+    Args:
+        model: Model name
+        messages: Chat messages
+        params: Other request parameters; transport-only ones such as
+            stream and timeout are ignored
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    params = {name: value for name, value in (params or {}).items() if name not in _TRANSPORT_PARAMS}
+    canonical = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """SQLite-backed LRU cache of response texts with a TTL."""
+
+    def __init__(self, path, max_entries=5000, ttl=7 * 24 * 60 * 60, mode="readwrite"):
+        """
+        Args:
+            path: SQLite file, or ":memory:"
+            max_entries: Entries kept before the least recently used are evicted
+            ttl: Seconds an entry stays valid, or None to keep entries until evicted
+            mode: One of MODES
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown response cache mode: {mode}")
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'expired': 0}
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        # WAL lets several app processes share the file
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Return the cached text for key, or None on a miss (including an expired entry)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats['expired'] += 1
+                row = None
+            if row is None:
+                self._stats['misses'] += 1
+            else:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self._stats['hits'] += 1
+        return row[0] if row is not None else None
+
+    def set(self, key, value):
+        """Store the text for key, evicting the least recently used entries beyond max_entries."""
+        if self.mode != "readwrite" or not value:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._stats['writes'] += 1
+            excess = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._stats['evictions'] += excess
+            self._conn.commit()
+
+    def stats(self):
+        """Hit, miss, write, eviction and expiry counts, plus the current number of entries."""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(self._stats, size=size, hit_rate=self._stats['hits'] / lookups if lookups else 0.0)
+
+@st.cache_resource
+def get_response_cache():
+    """
+    Get the process-wide response cache.
+
+    Returns:
+        The cache, or None when [openai] response_cache is "off" (the
+        default with the fake backends, so load tests always call them)
+    """
+    mode = get_setting('openai', 'response_cache', "off" if use_fake_backends() else "readwrite")
+    if mode == "off":
+        return None
+    return ResponseCache(
+        get_setting('openai', 'response_cache_path', ".llm_response_cache.sqlite"),
+        max_entries=get_setting('openai', 'response_cache_size', 5000),
+        ttl=get_setting('openai', 'response_cache_ttl', 7 * 24 * 60 * 60),
+        mode=mode
+    )
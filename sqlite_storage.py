@@ -0,0 +1,278 @@
+"""
+Embedded SQLite storage driver for the Relationship Reflection App.
+
+Stores the same documents as the Firestore driver in one local file, with
+indexes on user_id and topic and per-topic counters updated in the same
+transaction as each response or rating. Writes are synchronous and take
+well under a millisecond, so there is no write-behind queue; WAL mode lets
+several app processes share the file. Selected with [storage] driver =
+"sqlite".
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from persistence_queue import _decode, _encode
+from storage import StorageBackend, summarize_topic_counts
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    name TEXT,
+    age INTEGER,
+    gender TEXT,
+    relationship_status TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS responses (
+    response_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    schema_version INTEGER NOT NULL,
+    qa_pairs TEXT NOT NULL,
+    completed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_user_completed ON responses (user_id, completed_at, response_id);
+CREATE INDEX IF NOT EXISTS responses_topic ON responses (topic);
+CREATE TABLE IF NOT EXISTS ratings (
+    rating_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    informative_rating INTEGER,
+    engaging_rating INTEGER,
+    repeat_rating INTEGER,
+    overall_rating REAL,
+    feedback TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ratings_user ON ratings (user_id);
+CREATE INDEX IF NOT EXISTS ratings_topic ON ratings (topic);
+CREATE TABLE IF NOT EXISTS topic_stats (
+    topic TEXT PRIMARY KEY,
+    response_count INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum REAL NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+# Response columns, in document field order
+RESPONSE_COLUMNS = ['schema_version', 'response_id', 'user_id', 'topic', 'qa_pairs', 'completed_at']
+
+# Primary key of each of storage.EXPORT_TABLES, the tie-breaker for export pages
+EXPORT_KEYS = {'users': 'user_id', 'responses': 'response_id', 'ratings': 'rating_id', 'sessions': 'session_id'}
+
+def _timestamp(value):
+    """ISO text with fixed precision, so timestamps sort correctly as text."""
+    return value.isoformat(timespec='microseconds')
+
+def _merge(target, fields):
+    """Deep-merge fields into target, like a Firestore merge write."""
+    for key, value in fields.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+class SQLiteStorage(StorageBackend):
+    """SQLite driver; one connection shared by all sessions in the process."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path: SQLite file, or ":memory:"
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        # WAL lets several app processes share the file; NORMAL sync is durable in WAL mode
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def _write(self, statements):
+        """Run (sql, params) statements in one transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def save_user_profile(self, user_data):
+        self._write([(
+            "INSERT OR REPLACE INTO users (user_id, name, age, gender, relationship_status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (user_data['user_id'], user_data.get('name'), user_data.get('age'), user_data.get('gender'),
+             user_data.get('relationship_status'), _timestamp(user_data['created_at']))
+        )])
+
+    def save_session_results(self, response_data=None, rating_data=None):
+        topic = (response_data or rating_data)['topic']
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A re-saved response or rating is left as is and not counted again
+                new_response = new_rating = False
+                if response_data is not None:
+                    new_response = self._conn.execute(
+                        "INSERT INTO responses (response_id, user_id, topic, schema_version, qa_pairs, completed_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (response_id) DO NOTHING",
+                        (response_data['response_id'], response_data['user_id'], topic, response_data['schema_version'],
+                         json.dumps(response_data['qa_pairs'], ensure_ascii=False),
+                         _timestamp(response_data['completed_at']))
+                    ).rowcount == 1
+                if rating_data is not None:
+                    new_rating = self._conn.execute(
+                        "INSERT INTO ratings (rating_id, user_id, topic, informative_rating, engaging_rating, "
+                        "repeat_rating, overall_rating, feedback, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (rating_id) DO NOTHING",
+                        (rating_data['rating_id'], rating_data['user_id'], topic, rating_data['informative_rating'],
+                         rating_data['engaging_rating'], rating_data['repeat_rating'], rating_data['overall_rating'],
+                         rating_data.get('feedback'), _timestamp(rating_data['created_at']))
+                    ).rowcount == 1
+                if new_response or new_rating:
+                    self._conn.execute(
+                        "INSERT INTO topic_stats (topic, response_count, rating_count, rating_sum, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?) ON CONFLICT (topic) DO UPDATE SET "
+                        "response_count = response_count + excluded.response_count, "
+                        "rating_count = rating_count + excluded.rating_count, "
+                        "rating_sum = rating_sum + excluded.rating_sum, updated_at = excluded.updated_at",
+                        (topic, int(new_response), int(new_rating),
+                         rating_data['overall_rating'] if new_rating else 0, _timestamp(datetime.now()))
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _document(self, table, row):
+        """A row of an exported table as the equivalent document."""
+        if table == 'responses':
+            return self._response_document(row)
+        if table == 'sessions':
+            return json.loads(row['data'], object_hook=_decode)
+        # Users and ratings are stored flat, one column per document field
+        data = dict(row)
+        data['created_at'] = datetime.fromisoformat(data['created_at'])
+        return data
+
+    def _response_document(self, row):
+        data = {}
+        for column in row.keys():
+            if column == 'qa_pairs':
+                data[column] = json.loads(row[column])
+            elif column == 'completed_at':
+                data[column] = datetime.fromisoformat(row[column])
+            else:
+                data[column] = row[column]
+        return data
+
+    def get_user_responses_page(self, user_id, page_size=20, start_after=None, fields=None, descending=True):
+        columns = [column for column in RESPONSE_COLUMNS if not fields or column in fields]
+        # Keyset pagination on the (user_id, completed_at, response_id) index
+        selected = ", ".join(dict.fromkeys(columns + ['completed_at', 'response_id']))
+        direction, comparison = ("DESC", "<") if descending else ("ASC", ">")
+        sql = f"SELECT {selected} FROM responses WHERE user_id = ?"
+        params = [user_id]
+        if start_after is not None:
+            sql += f" AND (completed_at, response_id) {comparison} (?, ?)"
+            params.extend(start_after)
+        sql += f" ORDER BY completed_at {direction}, response_id {direction} LIMIT ?"
+        params.append(page_size)
+
+        rows = self._query(sql, params)
+        next_cursor = (rows[-1]['completed_at'], rows[-1]['response_id']) if len(rows) == page_size else None
+        documents = []
+        for row in rows:
+            data = self._response_document(row)
+            documents.append({column: data[column] for column in columns})
+        return documents, next_cursor
+
+    def get_response(self, response_id):
+        rows = self._query(f"SELECT {', '.join(RESPONSE_COLUMNS)} FROM responses WHERE response_id = ?",
+                           (response_id,))
+        return self._response_document(rows[0]) if rows else None
+
+    def get_topic_stats(self, topic):
+        rows = self._query("SELECT response_count, rating_count, rating_sum FROM topic_stats WHERE topic = ?", (topic,))
+        if not rows:
+            return summarize_topic_counts(0, 0, 0)
+        return summarize_topic_counts(rows[0]['response_count'], rows[0]['rating_count'], rows[0]['rating_sum'])
+
+    def get_all_topic_stats(self):
+        return {
+            row['topic']: summarize_topic_counts(row['response_count'], row['rating_count'], row['rating_sum'])
+            for row in self._query("SELECT topic, response_count, rating_count, rating_sum FROM topic_stats")
+        }
+
+    def save_session_checkpoint(self, session_id, fields, reset=False):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                data = json.loads(row['data'], object_hook=_decode) if row else {}
+                _merge(data, fields)
+                if reset:
+                    data.pop('questions', None)
+                    data.pop('responses', None)
+                # The column matches the document's updated_at, which exports use as their watermark
+                updated_at = data.get('updated_at')
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                    (session_id, json.dumps(data, default=_encode, ensure_ascii=False),
+                     _timestamp(updated_at if isinstance(updated_at, datetime) else datetime.now()))
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def load_session_checkpoint(self, session_id):
+        rows = self._query("SELECT data FROM sessions WHERE session_id = ?", (session_id,))
+        return json.loads(rows[0]['data'], object_hook=_decode) if rows else None
+
+    def iter_documents_since(self, table, timestamp_field, after=None, until=None, page_size=500):
+        key = EXPORT_KEYS[table]
+        selected = ", ".join(RESPONSE_COLUMNS) if table == 'responses' else "*"
+        conditions = [f"{timestamp_field} IS NOT NULL"]
+        params = []
+        if after is not None:
+            conditions.append(f"{timestamp_field} > ?")
+            params.append(_timestamp(after))
+        if until is not None:
+            conditions.append(f"{timestamp_field} <= ?")
+            params.append(_timestamp(until))
+
+        cursor = None
+        while True:
+            # Keyset pagination on (timestamp, primary key)
+            page_conditions = list(conditions)
+            page_params = list(params)
+            if cursor is not None:
+                page_conditions.append(f"({timestamp_field}, {key}) > (?, ?)")
+                page_params.extend(cursor)
+            rows = self._query(
+                f"SELECT {selected} FROM {table} "
+                f"WHERE {' AND '.join(page_conditions)} ORDER BY {timestamp_field}, {key} LIMIT ?",
+                page_params + [page_size]
+            )
+            if rows:
+                yield [self._document(table, row) for row in rows]
+            if len(rows) < page_size:
+                return
+            cursor = (rows[-1][timestamp_field], rows[-1][key])
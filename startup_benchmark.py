@@ -0,0 +1,111 @@
+"""
+Startup-time benchmark for the Relationship Reflection App.
+
+Measures, each in a fresh interpreter so nothing is already imported:
+- import time of the app module, and which heavy SDKs it pulled in
+- time to first paint: importing Streamlit and running the app's first
+  script run (the profile form) with AppTest
+
+Runs against the in-process fake backends so the background warm-up
+never touches the network. Use --json to append results to a file for
+tracking, and --max-import / --max-first-paint to fail on regressions.
+
+Usage:
+    python startup_benchmark.py --runs 5 --json startup_times.jsonl
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# SDKs that should only be loaded by the background warm-up
+HEAVY_MODULES = ("openai", "httpx", "firebase_admin", "google.cloud.firestore", "grpc", "tiktoken")
+
+IMPORT_SNIPPET = f"""
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy_modules": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+FIRST_PAINT_SNIPPET = """
+import json, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60).run()
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "error": str(at.exception[0].value) if at.exception else None}))
+"""
+
+def _run_snippet(snippet):
+    """Run a snippet in a fresh interpreter and return its JSON result line."""
+    env = dict(os.environ, DDMVT_FAKE_BACKENDS="1")
+    result = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=APP_DIR, env=env,
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def measure(runs):
+    """
+    Measure import time and time to first paint over several cold starts.
+
+    Returns:
+        Dictionary with the samples and medians in seconds, plus the heavy
+        SDKs loaded by importing the app
+    """
+    imports = [_run_snippet(IMPORT_SNIPPET) for _ in range(runs)]
+    first_paints = [_run_snippet(FIRST_PAINT_SNIPPET) for _ in range(runs)]
+    errors = [run["error"] for run in first_paints if run["error"]]
+    if errors:
+        raise RuntimeError(f"First paint failed: {errors[0]}")
+
+    import_samples = [run["seconds"] for run in imports]
+    first_paint_samples = [run["seconds"] for run in first_paints]
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "runs": runs,
+        "import_seconds": statistics.median(import_samples),
+        "first_paint_seconds": statistics.median(first_paint_samples),
+        "import_samples": import_samples,
+        "first_paint_samples": first_paint_samples,
+        "heavy_modules_at_import": sorted({m for run in imports for m in run["heavy_modules"]})
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts to measure")
+    parser.add_argument("--json", help="Append the results as one JSON line to this file")
+    parser.add_argument("--max-import", type=float, help="Fail if the median import time exceeds this many seconds")
+    parser.add_argument("--max-first-paint", type=float, help="Fail if the median first paint exceeds this many seconds")
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    print(f"App import:   {results['import_seconds']:.3f}s median "
+          f"(min {min(results['import_samples']):.3f}s, max {max(results['import_samples']):.3f}s)")
+    print(f"First paint:  {results['first_paint_seconds']:.3f}s median "
+          f"(min {min(results['first_paint_samples']):.3f}s, max {max(results['first_paint_samples']):.3f}s)")
+    print(f"Heavy SDKs loaded at import: {', '.join(results['heavy_modules_at_import']) or 'none'}")
+
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as f:
+            f.write(json.dumps(results) + "\n")
+
+    failed = False
+    if args.max_import is not None and results["import_seconds"] > args.max_import:
+        print(f"Import time regression: {results['import_seconds']:.3f}s > {args.max_import}s")
+        failed = True
+    if args.max_first_paint is not None and results["first_paint_seconds"] > args.max_first_paint:
+        print(f"First paint regression: {results['first_paint_seconds']:.3f}s > {args.max_first_paint}s")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
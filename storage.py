@@ -0,0 +1,125 @@
+"""
+Storage backends for the Relationship Reflection App.
+
+The data functions in firebase_utils build the app's documents (user
+profiles, responses, ratings, session checkpoints) and hand them to the
+storage driver selected by [storage] driver:
+- "firestore" (default): Cloud Firestore with write-behind batching
+- "sqlite": an embedded SQLite file, for local runs, small deployments
+  and fast deterministic perf tests without credentials or network
+"""
+
+import os
+import streamlit as st
+from config import get_setting
+
+DRIVERS = ("firestore", "sqlite")
+
+# Tables the analytics export reads with iter_documents_since
+EXPORT_TABLES = ("users", "responses", "ratings", "sessions")
+
+def summarize_topic_counts(response_count, rating_count, rating_sum):
+    """Build the public topic stats dict from raw counters."""
+    avg_rating = rating_sum / rating_count if rating_count else 0
+    return {
+        'response_count': response_count,
+        'avg_rating': round(avg_rating, 1),
+        'rating_count': rating_count
+    }
+
+class StorageBackend:
+    """
+    Interface every storage driver implements.
+
+    Documents are plain dicts shaped like the Firestore documents
+    described in the README; timestamps are datetimes.
+    """
+
+    def warm_up(self):
+        """Open connections ahead of the first real read or write."""
+
+    def save_user_profile(self, user_data):
+        """Save a user profile document."""
+        raise NotImplementedError
+
+    def save_session_results(self, response_data=None, rating_data=None):
+        """Save a response and/or rating and update the topic counters atomically."""
+        raise NotImplementedError
+
+    def save_responses(self, response_data):
+        """Save a response document and count it for its topic."""
+        self.save_session_results(response_data=response_data)
+
+    def save_rating(self, rating_data):
+        """Save a rating document and add it to its topic's rating stats."""
+        self.save_session_results(rating_data=rating_data)
+
+    def get_user_responses_page(self, user_id, page_size=20, start_after=None, fields=None, descending=True):
+        """
+        Get one page of a user's response documents, ordered by completed_at.
+
+        Returns:
+            Tuple of (list of documents, or of only the given fields, and
+            an opaque cursor for the next page or None)
+        """
+        raise NotImplementedError
+
+    def get_response(self, response_id):
+        """Get one response document, or None."""
+        raise NotImplementedError
+
+    def get_topic_stats(self, topic):
+        """Get a topic's stats dict (see summarize_topic_counts)."""
+        raise NotImplementedError
+
+    def get_all_topic_stats(self):
+        """Get the stats dict of every topic with any responses or ratings."""
+        raise NotImplementedError
+
+    def save_session_checkpoint(self, session_id, fields, reset=False):
+        """
+        Deep-merge fields into a session document; reset removes its
+        questions and responses.
+        """
+        raise NotImplementedError
+
+    def load_session_checkpoint(self, session_id):
+        """Get a session document, or None."""
+        raise NotImplementedError
+
+    def wait_until_idle(self, timeout=None):
+        """Block until deferred writes are committed; True if they all were."""
+        return True
+
+    def iter_documents_since(self, table, timestamp_field, after=None, until=None, page_size=500):
+        """
+        Yield a table's documents a page at a time, ordered by a timestamp.
+
+        Args:
+            table: One of EXPORT_TABLES
+            timestamp_field: Field to order and filter on, e.g. completed_at
+            after: Only documents with a later timestamp, or None for all
+            until: Only documents with this timestamp or earlier, or None
+            page_size: Documents read per page
+
+        Yields:
+            Lists of document dicts
+        """
+        raise NotImplementedError
+
+def storage_driver():
+    """The configured driver; DDMVT_STORAGE_DRIVER overrides it (e.g. for load tests)."""
+    return os.environ.get("DDMVT_STORAGE_DRIVER") or get_setting('storage', 'driver', "firestore")
+
+@st.cache_resource
+def get_storage():
+    """Get the process-wide storage driver selected by [storage] driver."""
+    driver = storage_driver()
+    if driver == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(os.environ.get("DDMVT_SQLITE_PATH")
+                             or get_setting('storage', 'sqlite_path', "reflections.sqlite"))
+    if driver == "firestore":
+        from firebase_utils import FirestoreStorage
+        return FirestoreStorage()
+    raise ValueError(f"Unknown storage driver {driver!r}; expected one of {', '.join(DRIVERS)}")
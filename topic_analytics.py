@@ -0,0 +1,312 @@
+"""
+Offline topic-performance analytics for the Relationship Reflection App.
+
+Loads the Parquet tables written by export_analytics.py into columnar
+frames and computes, per topic:
+- distributions of the informative / engaging / repeat ratings
+- a completion funnel from the session checkpoints: sessions started,
+  answers reached by question number, sessions reaching the summary and
+  completed (rated and saved) sessions, plus profiles -> started ->
+  completed users overall
+- answer and question length statistics
+- ratings broken down by relationship status and age band
+
+Everything is computed with vectorized pyarrow/pandas operations over
+whole columns, so millions of rows take seconds on one core. Answer and
+question texts are reduced to lengths while loading and never reach
+pandas. The result is written as a small JSON report that the topic
+selection page loads (load_topic_report) instead of querying Firestore.
+
+Usage:
+    python topic_analytics.py --input analytics --output analytics/topic_report.json
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+import streamlit as st
+from config import get_setting
+
+DEFAULT_REPORT_PATH = os.path.join("analytics", "topic_report.json")
+
+RATING_DIMENSIONS = ['informative', 'engaging', 'repeat']
+
+# Same bands as question_cache.age_band, as bin edges for pd.cut
+AGE_BAND_EDGES = [0, 25, 35, 45, 55, 65, float("inf")]
+AGE_BAND_LABELS = ["18-24", "25-34", "35-44", "45-54", "55-64", "65+"]
+
+LENGTH_PERCENTILES = [0.5, 0.9]
+
+# Session checkpoint stages in funnel order; topic selection isn't part of a topic's funnel
+STAGE_ORDER = {'questions': 1, 'summary': 2, 'completed': 3}
+
+def _read_table(input_dir, name, columns):
+    """Read some columns of an exported table, or None if it hasn't been exported."""
+    import pyarrow.dataset as ds
+    path = os.path.join(input_dir, name)
+    if not os.path.isdir(path):
+        return None
+    partitioning = ds.HivePartitioning.discover(infer_dictionary=True)
+    return ds.dataset(path, format="parquet", partitioning=partitioning).to_table(columns=columns)
+
+def _word_counts(strings):
+    """
+    Words per string of a chunked string array, counted as word starts in
+    the raw UTF-8 bytes; much faster than splitting into lists.
+    """
+    import numpy as np
+    import pyarrow as pa
+
+    counts = []
+    for chunk in strings.chunks:
+        _, offsets_buffer, data_buffer = chunk.buffers()
+        offsets = np.frombuffer(offsets_buffer, dtype=np.int32)[chunk.offset:chunk.offset + len(chunk) + 1]
+        data = np.frombuffer(data_buffer, dtype=np.uint8) if data_buffer is not None else np.empty(0, np.uint8)
+        data = data[offsets[0]:offsets[-1]]
+        offsets = offsets - offsets[0]
+        # ASCII whitespace: space, or tab to carriage return (uint8 wraps below 9)
+        space = (data == 32) | (data - np.uint8(9) <= np.uint8(4))
+        # A word starts at a non-space byte after a space or at the start of a string
+        starts = ~space
+        starts[1:] &= space[:-1]
+        first = offsets[:-1][offsets[1:] > offsets[:-1]]
+        starts[first] = ~space[first]
+        starts_before = np.searchsorted(np.flatnonzero(starts), offsets)
+        counts.append(pa.array(np.diff(starts_before).astype(np.int32)))
+    return pa.chunked_array(counts, type=pa.int32())
+
+def load_tables(input_dir):
+    """
+    Load the exported tables as DataFrames.
+
+    Returns:
+        Dictionary with responses (one row per answer, texts replaced by
+        question_chars, answer_chars and answer_words), ratings, users and
+        sessions; tables that haven't been exported are empty frames
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    responses = _read_table(input_dir, "responses",
+                            ["topic", "response_id", "user_id", "question_number", "question", "response"])
+    if responses is not None:
+        answers = pc.utf8_trim_whitespace(responses["response"])
+        responses = pa.table({
+            "topic": responses["topic"],
+            "user_id": responses["user_id"],
+            "question_number": responses["question_number"],
+            "question_chars": pc.utf8_length(responses["question"]),
+            "answer_chars": pc.utf8_length(answers),
+            "answer_words": _word_counts(responses["response"])
+        })
+    ratings = _read_table(input_dir, "ratings",
+                          ["topic", "user_id"] + [f"{dimension}_rating" for dimension in RATING_DIMENSIONS]
+                          + ["overall_rating"])
+    users = _read_table(input_dir, "users", ["user_id", "age", "relationship_status"])
+    sessions = _read_table(input_dir, "sessions", ["topic", "session_id", "user_id", "stage", "answers"])
+
+    def frame(table, columns):
+        return table.to_pandas() if table is not None else pd.DataFrame(columns=columns)
+
+    return {
+        'responses': frame(responses, ["topic", "user_id", "question_number",
+                                       "question_chars", "answer_chars", "answer_words"]),
+        'ratings': frame(ratings, ["topic", "user_id", "overall_rating"]
+                         + [f"{dimension}_rating" for dimension in RATING_DIMENSIONS]),
+        'users': frame(users, ["user_id", "age", "relationship_status"]),
+        'sessions': frame(sessions, ["topic", "session_id", "user_id", "stage", "answers"])
+    }
+
+def _round(value, digits=2):
+    """JSON-friendly float, with NaN (e.g. the mean of nothing) as None."""
+    value = float(value)
+    return None if value != value else round(value, digits)
+
+def _rating_distributions(ratings):
+    """Per topic and dimension: count, mean and counts of each score."""
+    columns = [f"{dimension}_rating" for dimension in RATING_DIMENSIONS]
+    scores = ratings.melt(id_vars=["topic"], value_vars=columns, var_name="dimension", value_name="score").dropna()
+    scores["dimension"] = scores["dimension"].str.removesuffix("_rating")
+    scores["score"] = scores["score"].astype(int)
+    counts = scores.groupby(["topic", "dimension", "score"], observed=True).size()
+    summary = scores.groupby(["topic", "dimension"], observed=True)["score"].agg(["count", "mean"])
+
+    result = {}
+    for (topic, dimension), row in summary.iterrows():
+        result.setdefault(topic, {})[dimension] = {
+            'count': int(row["count"]),
+            'mean': _round(row["mean"]),
+            'distribution': {str(score): int(count) for score, count in counts.loc[(topic, dimension)].items()}
+        }
+    overall = ratings.groupby("topic", observed=True)["overall_rating"].agg(["count", "mean"])
+    for topic, row in overall.iterrows():
+        result.setdefault(topic, {})['overall'] = {'count': int(row["count"]), 'mean': _round(row["mean"])}
+    return result
+
+def _session_progress(sessions):
+    """Exported checkpoints of sessions that got past topic selection, with the stage as a rank."""
+    progress = sessions.assign(stage_rank=sessions["stage"].map(STAGE_ORDER))
+    return progress[progress["stage_rank"].notna() & (progress["topic"].astype(str) != "unknown")]
+
+def _funnels(sessions):
+    """
+    Per topic: sessions started, how many answered each question, and how
+    many reached the summary and were completed.
+
+    A session's checkpoint is exported once per run while it changes, so
+    each session counts with the furthest point any of its rows reached.
+    """
+    progress = _session_progress(sessions)
+    furthest = progress.groupby(["topic", "session_id"], observed=True)[["stage_rank", "answers"]].max()
+
+    result = {}
+    for topic, rows in furthest.groupby(level="topic", observed=True):
+        started = len(rows)
+        completed = int((rows["stage_rank"] >= STAGE_ORDER['completed']).sum())
+        result[topic] = {
+            'started_sessions': started,
+            'summary_sessions': int((rows["stage_rank"] >= STAGE_ORDER['summary']).sum()),
+            'completed_sessions': completed,
+            'completion_rate': _round(completed / started),
+            'questions': [
+                {
+                    'question_number': number,
+                    'answered': int((rows["answers"] >= number).sum()),
+                    'answered_rate': _round((rows["answers"] >= number).sum() / started)
+                }
+                for number in range(1, int(rows["answers"].max()) + 1)
+            ]
+        }
+    return result
+
+def _length_stats(responses):
+    """Per topic: mean and percentiles of answer characters and words and question characters."""
+    columns = ["answer_chars", "answer_words", "question_chars"]
+    grouped = responses.groupby("topic", observed=True)[columns]
+    means = grouped.mean()
+    quantiles = grouped.quantile(LENGTH_PERCENTILES)
+    words_by_question = responses.groupby(["topic", "question_number"], observed=True)["answer_words"].mean()
+
+    result = {}
+    for topic in means.index:
+        result[topic] = {
+            column: dict(
+                {'mean': _round(means.loc[topic, column], 1)},
+                **{f"p{int(q * 100)}": _round(quantiles.loc[(topic, q), column], 1) for q in LENGTH_PERCENTILES}
+            )
+            for column in columns
+        }
+        result[topic]['answer_words_by_question'] = {
+            str(int(number)): _round(words, 1) for number, words in words_by_question.loc[topic].items()
+        }
+    return result
+
+def _age_bands(ages):
+    """Vectorized question_cache.age_band."""
+    import pandas as pd
+    bands = pd.cut(pd.to_numeric(ages, errors="coerce"), bins=AGE_BAND_EDGES, right=False, labels=AGE_BAND_LABELS)
+    return bands.cat.add_categories(["unknown"]).fillna("unknown")
+
+def _breakdowns(ratings, users):
+    """Per topic: rating count and means by relationship status and by age band."""
+    profiles = users.drop_duplicates("user_id")
+    rated = ratings.merge(profiles, on="user_id", how="left")
+    rated["relationship_status"] = rated["relationship_status"].fillna("Unknown")
+    rated["age_band"] = _age_bands(rated["age"])
+    columns = ["overall_rating"] + [f"{dimension}_rating" for dimension in RATING_DIMENSIONS]
+
+    result = {}
+    for group_column, name in [("relationship_status", "by_relationship_status"), ("age_band", "by_age_band")]:
+        grouped = rated.groupby(["topic", group_column], observed=True)
+        counts = grouped.size()
+        means = grouped[columns].mean()
+        for (topic, group), count in counts.items():
+            result.setdefault(topic, {}).setdefault(name, {})[str(group)] = dict(
+                {'count': int(count)},
+                **{column.removesuffix("_rating"): _round(means.loc[(topic, group), column]) for column in columns}
+            )
+    return result
+
+def compute_report(tables):
+    """
+    Compute the per-topic report from load_tables' frames.
+
+    Returns:
+        JSON-serializable report dictionary
+    """
+    responses, ratings, users = tables['responses'], tables['ratings'], tables['users']
+    progress = _session_progress(tables['sessions'])
+    sections = {
+        'ratings': _rating_distributions(ratings),
+        'funnel': _funnels(tables['sessions']),
+        'lengths': _length_stats(responses),
+        'breakdowns': _breakdowns(ratings, users)
+    }
+    topics = {}
+    for section, by_topic in sections.items():
+        for topic, values in by_topic.items():
+            if section == 'breakdowns':
+                topics.setdefault(topic, {}).update(values)
+            else:
+                topics.setdefault(topic, {})[section] = values
+
+    return {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'rows': {name: len(frame) for name, frame in tables.items()},
+        'funnel': {
+            'profiles': int(users["user_id"].nunique()),
+            'users_started': int(progress["user_id"].nunique()),
+            'users_completed': int(progress.loc[progress["stage_rank"] >= STAGE_ORDER['completed'], "user_id"].nunique())
+        },
+        'topics': topics
+    }
+
+def write_report(report, path):
+    """Write the report atomically, so the app never reads a torn file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(temp_path, path)
+
+@st.cache_data(ttl=get_setting('app', 'topic_report_ttl', 3600))
+def load_topic_report():
+    """
+    Load the precomputed topic report for the topic selection page.
+
+    Returns:
+        The report's per-topic dictionary, or {} if no report has been built
+    """
+    path = get_setting('app', 'topic_report_path', DEFAULT_REPORT_PATH)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('topics', {})
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def main():
+    """Build the report from exported tables and print a line per topic."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default="analytics", help="Directory export_analytics.py wrote to")
+    parser.add_argument("--output", default=DEFAULT_REPORT_PATH, help="Report file to write")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tables = load_tables(args.input)
+    loaded = time.perf_counter()
+    report = compute_report(tables)
+    write_report(report, args.output)
+    print(f"Loaded {', '.join(f'{count} {name} rows' for name, count in report['rows'].items())} "
+          f"in {loaded - start:.2f}s; computed the report in {time.perf_counter() - loaded:.2f}s")
+    for topic, stats in sorted(report['topics'].items()):
+        funnel = stats.get('funnel', {})
+        overall = stats.get('ratings', {}).get('overall', {})
+        print(f"  {topic}: {funnel.get('started_sessions', 0)} sessions started, "
+              f"{funnel.get('completed_sessions', 0)} completed, overall {overall.get('mean')}")
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Background warm-up of the Relationship Reflection App's backends.
+
+The Firebase, Firestore (gRPC) and OpenAI SDKs are imported lazily so the
+profile form renders without them. On the first page render a background
+thread imports them, initializes the Firebase app, opens the Firestore
+gRPC channel with a one-document read, primes the OpenAI connection pool
+and loads the question bank, so the first save and the first question
+don't pay for any of it.
+"""
+
+import logging
+import threading
+import time
+import streamlit as st
+from config import get_setting, use_fake_backends
+
+logger = logging.getLogger(__name__)
+
+_timings = {}
+
+def _run_step(name, step):
+    """Run one warm-up step, recording its duration; failures are only logged."""
+    start = time.perf_counter()
+    try:
+        step()
+    except BaseException:
+        # Includes st.stop() from missing credentials; the first real call reports it
+        logger.warning("Warm-up step %s failed", name, exc_info=True)
+    _timings[name] = time.perf_counter() - start
+
+def _warm_storage():
+    from storage import get_storage
+    get_storage().warm_up()
+
+def _warm_openai():
+    from openai_utils import initialize_openai
+    client = initialize_openai()
+    if use_fake_backends():
+        return
+    # A tiny request opens a keep-alive TLS connection in the client's pool
+    client.with_options(timeout=get_setting('openai', 'connect_timeout', 5) + 5).models.retrieve("gpt-5")
+
+def _warm_tokenizer():
+    from context_budget import count_tokens
+    count_tokens("warm-up")
+
+def _warm_question_bank():
+    from question_bank import load_question_bank
+    load_question_bank()
+
+def _warm_up():
+    _run_step("storage", _warm_storage)
+    _run_step("openai", _warm_openai)
+    _run_step("tokenizer", _warm_tokenizer)
+    _run_step("question_bank", _warm_question_bank)
+    logger.info("Backend warm-up finished: %s", {name: round(seconds, 3) for name, seconds in _timings.items()})
+
+@st.cache_resource
+def start_warmup():
+    """
+    Start warming up the backends once per process, if enabled.
+
+    Returns:
+        The warm-up thread, or None when [app] warmup is false
+    """
+    if not get_setting('app', 'warmup', True):
+        return None
+    thread = threading.Thread(target=_warm_up, name="backend-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def get_warmup_timings():
+    """Seconds each finished warm-up step took."""
+    return dict(_timings)